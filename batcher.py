@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+
+class MicroBatcher:
+    """Buffers links pushed by event handlers and flushes them in batches.
+
+    A flush happens once `max_links` links are pending or every `max_delay` seconds, whichever
+    comes first. A batch whose flush fails is merged back into the buffer and retried with the
+    next one.
+    """
+
+    def __init__(self, flush_callback, max_links=200, max_delay=300):
+        self.flush_callback = flush_callback
+        self.max_links = max_links
+        self.max_delay = max_delay
+        self.links = {}
+        self.pending = 0
+        self.lock = asyncio.Lock()
+
+    async def add(self, pairs):
+        for protocol, link in pairs:
+            protocol_links = self.links.setdefault(protocol, set())
+            if link not in protocol_links:
+                protocol_links.add(link)
+                self.pending += 1
+        if self.pending >= self.max_links:
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.links:
+                return
+            links = self.links
+            self.links, self.pending = {}, 0
+            try:
+                await self.flush_callback(links)
+            except Exception as e:
+                logging.error(f"Micro-batch flush failed, re-queueing {sum(map(len, links.values()))} links. Reason: {e}")
+                for protocol, protocol_links in links.items():
+                    self.links.setdefault(protocol, set()).update(protocol_links)
+                self.pending = sum(map(len, self.links.values()))
+
+    async def run(self):
+        """Flushes on the time threshold forever."""
+        while True:
+            await asyncio.sleep(self.max_delay)
+            await self.flush()
@@ -0,0 +1,36 @@
+"""Measures how much canonicalization shrinks the published lists on a synthetic corpus.
+
+Usage: python benchmarks/canonicalize.py [message_count]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from benchmarks.corpus import generate_messages
+from proxy_links import canonicalize_links
+
+
+def main_benchmark(count=20000):
+    messages = generate_messages(count, repost_rate=0.5, variant_rate=0.6)
+    raw_links = main.extract_links_batch(messages)
+    started = time.perf_counter()
+    canonical_links = canonicalize_links(raw_links)
+    elapsed = time.perf_counter() - started
+
+    raw_total = sum(len(links) for links in raw_links.values())
+    canonical_total = sum(len(links) for links in canonical_links.values())
+    print(f"messages: {count}, canonicalized {raw_total} links in {elapsed:.3f}s")
+    for protocol in raw_links:
+        raw, canonical = len(raw_links[protocol]), len(canonical_links[protocol])
+        print(f"{protocol:12} {raw:8} -> {canonical:8} ({canonical / raw if raw else 1:.1%})")
+    raw_bytes = sum(len("\n".join(links).encode()) for links in raw_links.values())
+    canonical_bytes = sum(len("\n".join(links).encode()) for links in canonical_links.values())
+    print(f"{'total':12} {raw_total:8} -> {canonical_total:8} ({canonical_total / raw_total:.1%}), "
+          f"attachments {raw_bytes / 1024:.0f} KiB -> {canonical_bytes / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
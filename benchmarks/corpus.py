@@ -0,0 +1,116 @@
+"""Synthetic Telegram channel corpora for the offline benchmarks.
+
+Messages mimic what the proxy channels actually post: Persian/emoji chatter, links in
+plain text, t.me/proxy links hidden behind MessageEntityTextUrl buttons and bare URLs
+marked with MessageEntityUrl.
+"""
+import base64
+import json
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from telethon.tl.types import MessageEntityTextUrl, MessageEntityUrl
+
+FILLER = [
+    "🔥 پروکسی جدید", "✅ متصل", "🚀 سرعت بالا", "📡 اتصال پایدار", "@ProxyChannel",
+    "کانال ما را به دوستان خود معرفی کنید", "⚡️", "#proxy", "#v2ray", "آپدیت شد",
+]
+
+
+@dataclass
+class FakeMessage:
+    id: int
+    text: str
+    entities: Optional[list] = None
+    date: datetime = field(default_factory=datetime.utcnow)
+
+
+def random_host(rng):
+    if rng.random() < 0.5:
+        return ".".join(str(rng.randint(1, 254)) for _ in range(4))
+    return f"{rng.choice(['srv', 'node', 'edge', 'cdn'])}{rng.randint(1, 999)}.{rng.choice(['example.com', 'proxy.net', 'fast.ir'])}"
+
+
+def random_link(rng, protocol):
+    host, port = random_host(rng), rng.choice([443, 8443, 2053, 2083, 80, rng.randint(1024, 65535)])
+    remark = rng.choice(["", "#🇩🇪Germany", "#Free", "#@ProxyChannel", "#🇳🇱NL-1"])
+    if protocol == "MTPROTO":
+        secret = "".join(rng.choice("0123456789abcdef") for _ in range(32))
+        return f"https://t.me/proxy?server={host}&port={port}&secret=ee{secret}"
+    if protocol == "VLESS":
+        uuid = "%08x-%04x-%04x-%04x-%012x" % tuple(rng.getrandbits(b) for b in (32, 16, 16, 16, 48))
+        return f"vless://{uuid}@{host}:{port}?type=ws&security=tls&path=%2F&sni={host}{remark}"
+    if protocol == "VMESS":
+        config = {"v": "2", "ps": remark.lstrip("#"), "add": host, "port": str(port),
+                  "id": "%08x-%04x-%04x-%04x-%012x" % tuple(rng.getrandbits(b) for b in (32, 16, 16, 16, 48)),
+                  "aid": "0", "net": "ws", "type": "none", "host": host, "path": "/", "tls": "tls"}
+        return "vmess://" + base64.b64encode(json.dumps(config).encode()).decode()
+    userinfo = base64.urlsafe_b64encode(f"chacha20-ietf-poly1305:{rng.getrandbits(64):x}".encode()).decode().rstrip("=")
+    return f"ss://{userinfo}@{host}:{port}{remark}"
+
+
+def mutate_link(rng, link):
+    """Re-posts a link the way other channels do: new remark, shuffled params, re-encoded
+    VMess JSON or trailing markdown/emoji."""
+    base, _, _ = link.partition("#")
+    if base.startswith("vmess://"):
+        config = json.loads(base64.b64decode(base[len("vmess://"):]))
+        config["ps"] = rng.choice(["🇩🇪 Germany", "@OtherChannel", "free"])
+        items = list(config.items())
+        rng.shuffle(items)
+        base = "vmess://" + base64.b64encode(json.dumps(dict(items)).encode()).decode()
+    elif "?" in base:
+        prefix, _, query = base.partition("?")
+        params = query.split("&")
+        rng.shuffle(params)
+        base = prefix + "?" + "&".join(params)
+    if not base.startswith("vmess://") and rng.random() < 0.7:
+        base += rng.choice(["#🔥Fast", "#@OtherChannel", "#🇳🇱Netherlands", "#Iran_MCI"])
+    return base + rng.choice(["", "", "**", ")", "🔥", ".", "`"])
+
+
+# Reposts are drawn from at most this many earlier links, which keeps memory flat for huge corpora.
+RECENT_LINKS = 10000
+
+
+def iter_messages(count, link_density=0.6, repost_rate=0.3, variant_rate=0.0, seed=1, start_id=1):
+    """Lazily yields `count` messages; `link_density` is the mean number of links per message,
+    `repost_rate` the chance a link is a repost of one seen earlier and `variant_rate` the
+    chance such a repost is a cosmetic variant (see mutate_link) rather than a verbatim copy."""
+    rng = random.Random(seed)
+    protocols = ["MTPROTO", "VLESS", "VMESS", "SHADOWSOCKS"]
+    seen_links: List[str] = []
+    base_date = datetime.utcnow() - timedelta(seconds=count)
+    for i in range(count):
+        parts, entities = [rng.choice(FILLER)], []
+        n_links = int(link_density) + (rng.random() < link_density % 1)
+        for _ in range(n_links):
+            if seen_links and rng.random() < repost_rate:
+                link = rng.choice(seen_links)
+                if rng.random() < variant_rate:
+                    link = mutate_link(rng, link)
+            else:
+                link = random_link(rng, rng.choice(protocols))
+                if len(seen_links) < RECENT_LINKS:
+                    seen_links.append(link)
+                else:
+                    seen_links[rng.randrange(RECENT_LINKS)] = link
+            text = " ".join(parts) + " "
+            if link.startswith("https://t.me/proxy") and rng.random() < 0.7:
+                label = "اتصال"
+                entities.append(MessageEntityTextUrl(offset=len(text), length=len(label), url=link))
+                parts.append(label)
+            else:
+                if rng.random() < 0.3:
+                    entities.append(MessageEntityUrl(offset=len(text), length=len(link)))
+                parts.append(link)
+            parts.append(rng.choice(FILLER))
+        yield FakeMessage(id=start_id + i, text=" ".join(parts), entities=entities or None,
+                          date=base_date + timedelta(seconds=i))
+
+
+def generate_messages(count, **kwargs):
+    """Same as iter_messages, materialized as a list."""
+    return list(iter_messages(count, **kwargs))
@@ -0,0 +1,181 @@
+"""End-to-end benchmark of one main.run_cycle against a replaying fake Telegram client.
+
+The real scrape, extraction, canonicalization, dedup and state code runs unchanged; only
+the network edges are replaced: channels come from benchmarks.corpus, liveness probing is
+off, and email/Telegram publishing are stubs that just count what they receive.
+
+Results are appended to a history file and compared with the previous run of the same
+size, so regressions in extraction and dedup show up as a non-zero exit code.
+
+Usage: python benchmarks/cycle.py [--messages N] [--channels N] [--sessions N] [--history PATH]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import iter_messages
+
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.jsonl')
+
+
+class FakeTelegramClient:
+    """Stands in for TelegramClient: every channel replays its own synthetic corpus."""
+
+    def __init__(self, channels, messages_per_channel, **corpus_kwargs):
+        self.channels = {name: index + 1 for index, name in enumerate(channels)}
+        self.messages_per_channel = messages_per_channel
+        self.corpus_kwargs = corpus_kwargs
+
+    async def get_entity(self, channel_name):
+        return SimpleNamespace(id=self.channels[channel_name], access_hash=0)
+
+    async def iter_messages(self, peer, reverse=True, min_id=0, offset_date=None, **kwargs):
+        channel_id = peer.channel_id
+        for i, message in enumerate(iter_messages(self.messages_per_channel, seed=channel_id, **self.corpus_kwargs)):
+            if message.id > min_id:
+                yield message
+            if i % 100 == 99:
+                # Yield to the loop like a real client does between GetHistory pages.
+                await asyncio.sleep(0)
+
+
+class StubOutbox:
+    def __init__(self):
+        self.queued = 0
+
+    def enqueue(self, body, recipients):
+        self.queued += len(recipients)
+
+    def depth(self):
+        return 0
+
+    def oldest_age(self):
+        return 0
+
+    def update_gauges(self):
+        pass
+
+
+class StubPublisher:
+    chat_ids = [1]
+
+    def __init__(self):
+        self.messages = 0
+
+    async def publish(self, messages):
+        self.messages += len(messages)
+        return len(messages)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_benchmark(total_messages, channel_count, session_count=1):
+    import main
+    from entity_cache import EntityCache
+    from metrics import registry
+    from proxy_links import canonical_key
+    from scrape_state import StateStore
+    from seen_links import SeenLinkIndex
+    from sessions import Session, SessionPool
+    from subscriptions import SubscriptionStore
+
+    channels = [f"https://t.me/bench_channel_{i}" for i in range(channel_count)]
+    main.CHANNELS = channels
+    main.PROBE_ENABLED = False
+    main.MAIL_FROM_ADDRESS = "bench@example.com"
+    main.get_email_recipients = lambda: ["bench@example.com"]
+    pool = SessionPool([Session(f"bench{i}", FakeTelegramClient(channels, total_messages // channel_count))
+                        for i in range(session_count)])
+
+    with tempfile.TemporaryDirectory() as storage:
+        state_store = StateStore(os.path.join(storage, 'last_message_ids.json'))
+        entity_caches = {session.name: EntityCache(os.path.join(storage, f'entities.{session.name}.json'),
+                                                   main.ENTITY_CACHE_TTL) for session in pool}
+        seen_index = SeenLinkIndex(os.path.join(storage, 'seen_links.sqlite3'), main.SEEN_LINKS_TTL,
+                                   key_func=canonical_key)
+        outbox, publisher = StubOutbox(), StubPublisher()
+        subscriptions = SubscriptionStore(os.path.join(storage, 'subscriptions'), main.REGEX_PATTERNS)
+
+        started = time.perf_counter()
+        await main.run_cycle(pool, state_store, entity_caches, seen_index, outbox, publisher, subscriptions)
+        elapsed = time.perf_counter() - started
+        seen_index.close()
+
+    snapshot = registry.snapshot()
+    messages = snapshot['counters'].get('messages_scanned_total', 0)
+    links = sum(value for name, value in snapshot['counters'].items() if name.startswith('links_found_total'))
+    published = sum(value for name, value in snapshot['counters'].items() if name.startswith('links_published_total'))
+    stages = {name[len('stage_seconds{stage="'):-2]: round(h['sum'], 4)
+              for name, h in snapshot['histograms'].items() if name.startswith('stage_seconds')}
+    return {
+        'timestamp': time.time(),
+        'messages': messages,
+        'channels': channel_count,
+        'sessions': session_count,
+        'seconds': round(elapsed, 3),
+        'messages_per_sec': round(messages / elapsed),
+        'links_per_sec': round(links / elapsed),
+        'links_found': links,
+        'links_published': published,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'stage_seconds': stages,
+    }
+
+
+def compare_with_history(result, history_path, threshold):
+    """Returns the regressions against the last run with the same corpus size."""
+    previous = None
+    if os.path.exists(history_path):
+        with open(history_path, 'r') as f:
+            for line in f:
+                entry = json.loads(line)
+                if all(entry.get(key, 1) == result[key] for key in ('messages', 'channels', 'sessions')):
+                    previous = entry
+    regressions = []
+    if previous:
+        for key in ('messages_per_sec', 'links_per_sec'):
+            if result[key] < previous[key] * (1 - threshold):
+                regressions.append(f"{key}: {previous[key]} -> {result[key]}")
+        if result['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + threshold):
+            regressions.append(f"peak_rss_mb: {previous['peak_rss_mb']} -> {result['peak_rss_mb']}")
+    with open(history_path, 'a') as f:
+        f.write(json.dumps(result) + "\n")
+    return previous, regressions
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000, help="total messages across all channels (1k-1M)")
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--sessions', type=int, default=1, help="fake Telegram accounts sharing the channels")
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument('--threshold', type=float, default=0.2, help="relative change treated as a regression")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_benchmark(args.messages, args.channels, args.sessions))
+    previous, regressions = compare_with_history(result, args.history, args.threshold)
+    print(json.dumps(result, indent=2))
+    if previous is None:
+        print("No previous run of this size in the history; recorded as the baseline.")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return not regressions
+
+
+if __name__ == "__main__":
+    # Keep the benchmark offline and quiet before main.py reads its configuration.
+    os.environ.setdefault('METRICS_PORT', '0')
+    os.environ['PROBE_ENABLED'] = 'false'
+    import logging
+    logging.disable(logging.INFO)
+    sys.exit(0 if main_benchmark() else 1)
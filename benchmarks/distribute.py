@@ -0,0 +1,173 @@
+"""Runs the credential distributor against a fake Telegram client that injects flood errors.
+
+Every send has a fixed latency (plus 3 s per uploaded image) and fails with FloodWaitError /
+PeerFloodError at the given rates. All distributor timings (send intervals, flood waits, the PeerFlood pause) are scaled
+by --time-scale so a run over hundreds of users finishes in seconds; the reported "real"
+figures are scaled back.
+
+With --sessions N the members are sharded over N fake accounts; --limited-session makes one
+of them fail every send with PeerFloodError, to exercise failover.
+
+Usage: python benchmarks/distribute.py [--users N] [--concurrency N] [--sessions N] [--flood-rate P] [--peer-flood-rate P]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telethon.errors import FloodWaitError, PeerFloodError
+
+from publisher import AdaptiveRateLimiter
+
+
+class FakeDistributorClient:
+    """Accepts send_message/send_file, failing each call with the configured probabilities."""
+
+    def __init__(self, participants, latency, flood_rate, peer_flood_rate, flood_seconds, seed=0, upload_latency=0):
+        self.participants = participants
+        self.latency = latency
+        self.upload_latency = upload_latency
+        self.flood_rate = flood_rate
+        self.peer_flood_rate = peer_flood_rate
+        self.flood_seconds = flood_seconds
+        self.random = random.Random(seed)
+        self.calls = self.floods = self.peer_floods = self.photo_ids = self.uploads = 0
+        self.first_send_at = None
+
+    async def _call(self):
+        self.calls += 1
+        self.first_send_at = self.first_send_at or time.perf_counter()
+        await asyncio.sleep(self.latency)
+        roll = self.random.random()
+        if roll < self.flood_rate:
+            self.floods += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        if roll < self.flood_rate + self.peer_flood_rate:
+            self.peer_floods += 1
+            raise PeerFloodError(request=None)
+
+    async def iter_participants(self, group_id, filter=None):
+        # Pages of 200 like GetParticipants, each costing one round trip.
+        for i, user in enumerate(self.participants):
+            if i % 200 == 0:
+                await asyncio.sleep(self.latency)
+            yield user
+
+    async def send_message(self, user_id, text, **kwargs):
+        await self._call()
+        return SimpleNamespace(id=self.calls)
+
+    async def send_file(self, user_id, files, **kwargs):
+        files_list = files if isinstance(files, list) else [files]
+        # A path is an upload, which takes a while; a cached InputPhoto is sent by reference.
+        uploads = sum(isinstance(file, str) for file in files_list)
+        self.uploads += uploads
+        await asyncio.sleep(uploads * self.upload_latency)
+        await self._call()
+        messages = []
+        for _ in files_list:
+            self.photo_ids += 1
+            messages.append(SimpleNamespace(photo=SimpleNamespace(id=self.photo_ids, access_hash=0, file_reference=b"")))
+        return messages if isinstance(files, list) else messages[0]
+
+
+async def run_benchmark(users, concurrency, flood_rate, peer_flood_rate, time_scale, seed, session_count=1,
+                        limited_session=False):
+    import vpndistributor
+    from credential_store import CredentialStore
+    from media_cache import MediaCache
+    from sessions import Session, SessionPool
+
+    vpndistributor.PEER_FLOOD_PAUSE *= time_scale
+    vpndistributor.CONCURRENT_USERS = concurrency
+    vpndistributor.MEMBER_REFRESH_INTERVAL *= time_scale
+    participants = [SimpleNamespace(id=1000 + i, first_name=f"user{i}", bot=(i % 50 == 0)) for i in range(users)]
+    clients = [FakeDistributorClient(participants, latency=0.5 * time_scale, flood_rate=flood_rate,
+                                     peer_flood_rate=1.0 if limited_session and i == 0 else peer_flood_rate,
+                                     flood_seconds=30, seed=seed + i, upload_latency=3 * time_scale)
+               for i in range(session_count)]
+    pool = SessionPool([Session(f"bench{i}", client) for i, client in enumerate(clients)], vpndistributor.PEER_FLOOD_PAUSE)
+
+    with tempfile.TemporaryDirectory() as storage:
+        store = CredentialStore(os.path.join(storage, 'credentials.sqlite3'))
+        store.import_rows((f"ssh{i}", "password", "host.example.com", False) for i in range(users))
+        media_caches = {session.name: MediaCache(os.path.join(storage, f'media_cache.{session.name}.json'))
+                        for session in pool}
+        # FakeDistributorClient raises FloodWaitError(30); scale the limiter and its penalties alike.
+        limiters = {session.name: ScaledLimiter(time_scale, vpndistributor.SEND_INTERVAL_START * time_scale,
+                                                vpndistributor.SEND_INTERVAL_MIN * time_scale,
+                                                vpndistributor.SEND_INTERVAL_MAX * time_scale) for session in pool}
+
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # guide images are relative paths
+        vpndistributor.SENT_USERS_FILE = os.path.join(storage, 'sent_users.txt')
+        started = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                await vpndistributor.distribute_sharded(pool, store, media_caches, limiters)
+        finally:
+            os.chdir(cwd)
+        elapsed = time.perf_counter() - started
+        counts = store.counts()
+        store.close()
+
+    return {
+        'users': users,
+        'concurrency': concurrency,
+        'sessions': session_count,
+        'failed_sessions': session_count - len(pool.alive()),
+        'served': counts.get('sent', 0),
+        'unserved': counts.get('free', 0) + counts.get('claimed', 0),
+        'sends': sum(client.calls for client in clients),
+        'flood_waits': sum(client.floods for client in clients),
+        'peer_floods': sum(client.peer_floods for client in clients),
+        'image_uploads': sum(client.uploads for client in clients),
+        'final_interval_s': [round(limiter.interval / time_scale, 2) for limiter in limiters.values()],
+        'first_send_s': round((min(c.first_send_at for c in clients if c.first_send_at) - started) / time_scale, 1),
+        'real_hours': round(elapsed / time_scale / 3600, 2),
+        # The old loop: a fixed 120 s after every user plus 2 s between each of its 4 sends.
+        'sequential_hours': round(sum(not user.bot for user in participants) * 126 / 3600, 2),
+    }
+
+
+class ScaledLimiter(AdaptiveRateLimiter):
+    """AdaptiveRateLimiter whose flood penalties are scaled like every other duration."""
+
+    def __init__(self, time_scale, *args):
+        super().__init__(*args)
+        self.time_scale = time_scale
+
+    def flood(self, seconds=0):
+        super().flood(seconds * self.time_scale)
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=3)
+    parser.add_argument('--flood-rate', type=float, default=0.02, help="probability of a FloodWaitError per send")
+    parser.add_argument('--peer-flood-rate', type=float, default=0.0, help="probability of a PeerFloodError per send")
+    parser.add_argument('--time-scale', type=float, default=0.001, help="simulated seconds per real second")
+    parser.add_argument('--sessions', type=int, default=1, help="fake accounts sharing the members")
+    parser.add_argument('--limited-session', action='store_true', help="make the first account fail with PeerFloodError")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    result = asyncio.run(run_benchmark(args.users, args.concurrency, args.flood_rate, args.peer_flood_rate,
+                                       args.time_scale, args.seed, args.sessions, args.limited_session))
+    for key, value in result.items():
+        print(f"{key:>18}: {value}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,95 @@
+"""Micro-benchmark: legacy per-pattern extraction vs. the single-pass LINK_REGEX engine.
+
+The legacy path uses the original patterns, pinned below. The one intended difference is
+Shadowsocks: the original `ss://` also matched inside `vless://...`, so every VLESS link was
+reported a second time as a bogus Shadowsocks link. Those pairs are counted separately, and
+any other difference is a mismatch.
+
+Usage: python benchmarks/extract_links.py [message_count]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telethon.tl.types import MessageEntityTextUrl, MessageEntityUrl
+
+import main
+from benchmarks.corpus import generate_messages
+
+
+# REGEX_PATTERNS as they were before LINK_REGEX; SHADOWSOCKS is now anchored with \b.
+LEGACY_PATTERNS = {
+    "MTPROTO": r"https?://t\.me/proxy\?[^\s]+",
+    "VLESS": r"vless://[^\s]+",
+    "VMESS": r"vmess://[^\s]+",
+    "SHADOWSOCKS": r"ss://[^\s]+"
+}
+
+
+def legacy_extract_links(message):
+    """The pre-LINK_REGEX extract_links plus main_task's re-classification loop."""
+    extracted_links = set()
+    text = message.text or ""
+    for pattern in LEGACY_PATTERNS.values():
+        extracted_links.update(re.findall(pattern, text, re.IGNORECASE))
+    if message.entities:
+        for entity in message.entities:
+            if isinstance(entity, (MessageEntityTextUrl, MessageEntityUrl)):
+                url = entity.url if isinstance(entity, MessageEntityTextUrl) else text[entity.offset:entity.offset+entity.length]
+                for pattern in LEGACY_PATTERNS.values():
+                    if re.match(pattern, url, re.IGNORECASE):
+                        extracted_links.add(url); break
+    pairs = set()
+    for link in extracted_links:
+        for protocol, pattern in LEGACY_PATTERNS.items():
+            if re.match(pattern, link, re.IGNORECASE):
+                pairs.add((protocol, link)); break
+    return pairs
+
+
+def is_embedded_ss(pair, text):
+    """True for a legacy Shadowsocks link that only occurs glued to a word, e.g. inside vless://."""
+    protocol, link = pair
+    return protocol == "SHADOWSOCKS" and not re.search(r"(?<!\w)" + re.escape(link), text, re.IGNORECASE)
+
+
+def compare(messages):
+    """Returns (ids of messages with unexpected differences, number of embedded ss:// pairs dropped)."""
+    mismatches, embedded_ss = [], 0
+    for message in messages:
+        legacy, single_pass = legacy_extract_links(message), set(main.extract_links(message))
+        dropped = {pair for pair in legacy - single_pass if is_embedded_ss(pair, message.text or "")}
+        embedded_ss += len(dropped)
+        if legacy - dropped != single_pass:
+            mismatches.append(message.id)
+    return mismatches, embedded_ss
+
+
+def timed(fn, messages, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for message in messages:
+            fn(message)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main_benchmark(count=50000):
+    messages = generate_messages(count)
+    mismatches, embedded_ss = compare(messages)
+    legacy = timed(legacy_extract_links, messages)
+    single_pass = timed(main.extract_links, messages)
+    print(f"messages: {count}, mismatches: {len(mismatches)}, "
+          f"bogus ss:// links from inside other links no longer reported: {embedded_ss}")
+    print(f"legacy:      {count / legacy:12,.0f} msg/s ({legacy:.3f}s)")
+    print(f"single-pass: {count / single_pass:12,.0f} msg/s ({single_pass:.3f}s)")
+    print(f"speedup:     {legacy / single_pass:.2f}x")
+    return not mismatches
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50000) else 1)
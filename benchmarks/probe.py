@@ -0,0 +1,78 @@
+"""Checks the liveness prober against local stand-in proxies.
+
+Starts a few TCP listeners on 127.0.0.1 and ranks links that point at them, at a closed
+port, at unresolvable and malformed hosts (empty label, label over 63 characters) and one
+link that cannot be parsed at all. Prints what was kept and exits non-zero if any link
+ended up on the wrong side, or if ranking raised.
+
+Usage: python benchmarks/probe.py [--listeners N] [--timeout SECONDS]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prober import rank_links
+
+
+def mtproto(host, port):
+    return f"https://t.me/proxy?server={host}&port={port}&secret=ee0123456789abcdef"
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def run_check(listener_count, timeout):
+    servers = [await asyncio.start_server(lambda reader, writer: writer.close(), '127.0.0.1', 0)
+               for _ in range(listener_count)]
+    reachable = [mtproto('127.0.0.1', server.sockets[0].getsockname()[1]) for server in servers]
+    reachable.append(mtproto('localhost', servers[0].sockets[0].getsockname()[1]))
+    unreachable = [
+        mtproto('127.0.0.1', closed_port()),
+        mtproto('no-such-host.invalid', 443),
+        mtproto('a..b.com', 443),
+        mtproto(f"{'a' * 64}.example.com", 443),
+    ]
+    unparsed = ["https://t.me/proxy?server=example.com&secret=ee00"]  # no port
+
+    started = time.perf_counter()
+    try:
+        ranked = await rank_links({'MTPROTO': reachable + unreachable + unparsed}, concurrency=50,
+                                  timeout=timeout, dns_timeout=timeout)
+    finally:
+        for server in servers:
+            server.close()
+    elapsed = time.perf_counter() - started
+
+    kept = ranked['MTPROTO']
+    errors = [f"dropped reachable link {link}" for link in reachable if link not in kept]
+    errors += [f"kept unreachable link {link}" for link in unreachable if link in kept]
+    errors += [f"dropped unparsable link {link}" for link in unparsed if link not in kept]
+    if kept[-len(unparsed):] != unparsed:
+        errors.append("unparsable links were not ranked last")
+    print(f"ranked {len(reachable) + len(unreachable) + len(unparsed)} links in {elapsed:.2f}s: "
+          f"kept {len(kept)}, dropped {len(reachable) + len(unreachable) + len(unparsed) - len(kept)}")
+    return errors
+
+
+def main_check():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listeners', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=2.0)
+    args = parser.parse_args()
+
+    errors = asyncio.run(run_check(args.listeners, args.timeout))
+    for error in errors:
+        print(f"FAIL: {error}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main_check()
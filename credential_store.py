@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import time
+
+FREE, CLAIMED, SENT = 'free', 'claimed', 'sent'
+
+
+class CredentialStore:
+    """SQLite pool of SSH credentials, imported once from the Excel sheet.
+
+    A credential moves free -> claimed -> sent. `claim` reserves the next free credential for
+    one user in a single transaction, so it is O(log n) through a partial index on the free
+    rows and durable before anything is sent. If the run dies mid-send, the claim survives and
+    the same user gets the same credential again on the next run; a credential is never handed
+    to two users, and `mark_sent` is the only way a claim becomes final. A user that cannot be
+    served gets their claim back through `release`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS credentials (
+                id INTEGER PRIMARY KEY,
+                username TEXT NOT NULL UNIQUE,
+                password TEXT NOT NULL,
+                hostname TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'free',
+                user_id INTEGER,
+                claimed_at REAL,
+                sent_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS credentials_free ON credentials (id) WHERE state = 'free';
+            CREATE UNIQUE INDEX IF NOT EXISTS credentials_user ON credentials (user_id) WHERE user_id IS NOT NULL;
+        """)
+        self.db.commit()
+
+    def import_rows(self, rows):
+        """Adds credentials from (username, password, hostname, taken) rows; returns how many were new.
+
+        Rows whose username is already in the store are ignored, so the sheet can be
+        re-imported after appending credentials without touching existing claims.
+        """
+        with self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO credentials (username, password, hostname, state) VALUES (?, ?, ?, ?)",
+                ((str(username).strip(), str(password).strip(), str(hostname).strip(), SENT if taken else FREE)
+                 for username, password, hostname, taken in rows))
+            return self.db.total_changes - before
+
+    def sent_user_ids(self):
+        return {row[0] for row in self.db.execute(
+            "SELECT user_id FROM credentials WHERE state = ? AND user_id IS NOT NULL", (SENT,))}
+
+    def claim(self, user_id):
+        """Returns (username, password, hostname) reserved for `user_id`, or None if the pool is empty.
+
+        A user that already holds an unsent claim gets that same credential back.
+        """
+        with self.db:
+            row = self.db.execute("SELECT username, password, hostname FROM credentials WHERE user_id = ? AND state = ?",
+                                  (user_id, CLAIMED)).fetchone()
+            if row:
+                return row
+            row = self.db.execute("SELECT id, username, password, hostname FROM credentials WHERE state = ? "
+                                  "ORDER BY id LIMIT 1", (FREE,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE credentials SET state = ?, user_id = ?, claimed_at = ? WHERE id = ?",
+                            (CLAIMED, user_id, time.time(), row[0]))
+            return row[1:]
+
+    def mark_sent(self, user_id):
+        with self.db:
+            self.db.execute("UPDATE credentials SET state = ?, sent_at = ? WHERE user_id = ? AND state = ?",
+                            (SENT, time.time(), user_id, CLAIMED))
+
+    def release(self, user_id):
+        """Returns a user's unsent claim to the pool."""
+        with self.db:
+            self.db.execute("UPDATE credentials SET state = ?, user_id = NULL, claimed_at = NULL "
+                            "WHERE user_id = ? AND state = ?", (FREE, user_id, CLAIMED))
+
+    def pending_claims(self):
+        return [row[0] for row in self.db.execute("SELECT user_id FROM credentials WHERE state = ?", (CLAIMED,))]
+
+    def counts(self):
+        """Returns {state: number of credentials}."""
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM credentials GROUP BY state"))
+
+    def rows(self):
+        """Yields (username, password, hostname, taken) in import order, for exporting back to Excel."""
+        for username, password, hostname, state in self.db.execute(
+                "SELECT username, password, hostname, state FROM credentials ORDER BY id"):
+            yield username, password, hostname, state != FREE
+
+    def close(self):
+        self.db.close()
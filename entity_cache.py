@@ -0,0 +1,56 @@
+import json
+import logging
+import os
+import time
+
+from telethon.tl.types import InputPeerChannel
+
+
+class EntityCache:
+    """Persistent map of channel URL -> (id, access_hash), so channels are not re-resolved
+    with a ResolveUsername call every cycle.
+
+    Entries are only dropped when they are older than `ttl` or when the caller reports that
+    the cached peer no longer works (see `invalidate`). Access hashes are per account, so
+    each session needs its own cache file.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f: self.entries = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logging.error(f"Error loading entity cache, starting empty: {e}")
+
+    def save(self):
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f: json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            logging.error(f"Error saving entity cache: {e}")
+
+    def get(self, channel_name, now=None):
+        now = time.time() if now is None else now
+        entry = self.entries.get(channel_name)
+        if entry and now - entry['resolved_at'] <= self.ttl:
+            return InputPeerChannel(entry['id'], entry['access_hash'])
+        return None
+
+    async def resolve(self, client, channel_name):
+        """Returns (InputPeerChannel, from_cache), resolving and caching the channel on a miss."""
+        peer = self.get(channel_name)
+        if peer:
+            return peer, True
+        entity = await client.get_entity(channel_name)
+        self.entries[channel_name] = {'id': entity.id, 'access_hash': entity.access_hash, 'resolved_at': time.time()}
+        self.save()
+        return InputPeerChannel(entity.id, entity.access_hash), False
+
+    def invalidate(self, channel_name):
+        if self.entries.pop(channel_name, None) is not None:
+            logging.warning(f"Dropped cached entity for {channel_name}.")
+            self.save()
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+MAX_HEADER_LINES = 100
+
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    if not request_line:
+        return None
+    method, path, _ = request_line.split(' ', 2)
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return method, path.split('?', 1)[0], headers
+
+
+async def start_http_server(host, port, handler):
+    """Starts a minimal HTTP/1.1 server for small local endpoints.
+
+    `handler(method, path, headers)` returns (status, headers, body bytes); header names in the
+    request are lower-cased. Every connection serves one request and is then closed.
+    """
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(_read_request(reader), timeout=10)
+            if request is None:
+                return
+            method, path, headers = request
+            status, response_headers, body = await handler(method, path, headers)
+            head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+            head += [f"{name}: {value}" for name, value in response_headers.items()]
+            head += [f"Content-Length: {len(body)}", "Connection: close", "", ""]
+            writer.write("\r\n".join(head).encode('latin-1') + (body if method != 'HEAD' else b""))
+            await writer.drain()
+        except (asyncio.TimeoutError, ValueError, ConnectionError) as e:
+            logging.debug(f"Dropped HTTP connection: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"HTTP server listening on {host}:{port}.")
+    return server
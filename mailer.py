@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import queue
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+
+from metrics import registry as metrics
+
+
+def serialize_message(msg):
+    """Serializes a message without a To header, once, for reuse across all recipients."""
+    del msg['To']
+    # The message's own compat32 policy RFC 2047-encodes the Persian subject; policy.SMTP
+    # would try to write it as raw ASCII.
+    return msg.as_bytes(policy=msg.policy.clone(linesep='\r\n'))
+
+
+def personalize(body, recipient):
+    """Prepends the recipient's To header to a serialized message body."""
+    return f"To: {recipient}\r\n".encode('utf-8') + body
+
+
+class SmtpPool:
+    """Sends one pre-serialized message to many recipients over a pool of SMTP connections.
+
+    Each of the `pool_size` workers keeps its own connection open and reconnects after
+    `max_per_connection` messages or after any error, so a single bad recipient or a dropped
+    connection only affects that worker's current message. If a worker cannot connect at all,
+    every job still queued fails at once and is left to the outbox's retries.
+    """
+
+    def __init__(self, host, port, user, password, from_address,
+                 pool_size=4, max_per_connection=50, starttls=True, timeout=90):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.from_address = from_address
+        self.pool_size = max(1, pool_size)
+        self.max_per_connection = max(1, max_per_connection)
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _worker(self, body, jobs, sent, failed, lock):
+        server, sent_on_connection = None, 0
+        try:
+            while True:
+                try:
+                    recipient = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                if server is None or sent_on_connection >= self.max_per_connection:
+                    if server is not None:
+                        try:
+                            server.quit()
+                        except Exception:
+                            server.close()
+                    try:
+                        server, sent_on_connection = self.connect(), 0
+                    except Exception as e:
+                        # The server is unreachable or refuses us; fail the rest of the batch at
+                        # once instead of reconnecting for every recipient.
+                        server, remaining = None, [recipient]
+                        while True:
+                            try:
+                                remaining.append(jobs.get_nowait())
+                            except queue.Empty:
+                                break
+                        with lock:
+                            failed.update((job, e) for job in remaining)
+                        logging.error(f"Could not connect to the SMTP server; {len(remaining)} emails failed. Reason: {e}")
+                        return
+                try:
+                    server.sendmail(self.from_address, [recipient], personalize(body, recipient))
+                    sent_on_connection += 1
+                    with lock:
+                        sent.append(recipient)
+                    logging.info(f"Email successfully sent to {recipient}")
+                except Exception as e:
+                    with lock:
+                        failed[recipient] = e
+                    logging.error(f"Email to {recipient} failed. Reason: {e}")
+                    if server is not None:
+                        server.close()
+                    server = None
+        finally:
+            if server is not None:
+                try:
+                    server.quit()
+                except Exception:
+                    server.close()
+
+    def send(self, body, recipients):
+        """Delivers `body` to every recipient; returns (sent recipients, {recipient: error})."""
+        jobs = queue.Queue()
+        for recipient in recipients:
+            jobs.put(recipient)
+        sent, failed, lock = [], {}, threading.Lock()
+        workers = [
+            threading.Thread(target=self._worker, args=(body, jobs, sent, failed, lock), daemon=True)
+            for _ in range(min(self.pool_size, len(recipients)))
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sent, failed
+
+
+class Outbox:
+    """Durable on-disk queue of pending (cycle, recipient) email jobs.
+
+    The serialized message of each cycle is stored once next to its jobs, so delivery can be
+    retried by a background worker and resumes after a restart. Failed jobs are retried with
+    exponential backoff and jitter, and are dropped after `max_attempts`.
+    """
+
+    def __init__(self, path, base_delay=30, max_delay=3600, max_attempts=20):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.wakeup = asyncio.Event()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                cycle TEXT PRIMARY KEY,
+                body BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                cycle TEXT NOT NULL REFERENCES messages (cycle),
+                recipient TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL,
+                PRIMARY KEY (cycle, recipient)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_next_attempt_at ON jobs (next_attempt_at);
+        """)
+        self.db.commit()
+
+    def enqueue(self, body, recipients, now=None):
+        """Queues `body` for every recipient under a new cycle id and returns that id."""
+        now = time.time() if now is None else now
+        # Readable, but unique even when two batches are queued within the same second.
+        cycle = f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now))}-{uuid.uuid4().hex[:12]}"
+        with self.db:
+            self.db.execute("INSERT INTO messages (cycle, body) VALUES (?, ?)", (cycle, body))
+            self.db.executemany(
+                "INSERT OR IGNORE INTO jobs (cycle, recipient, created_at, next_attempt_at) VALUES (?, ?, ?, ?)",
+                ((cycle, recipient, now, now) for recipient in recipients))
+        self.wakeup.set()
+        logging.info(f"Queued email for cycle {cycle} to {len(recipients)} recipients.")
+        return cycle
+
+    def due(self, now=None):
+        """Returns {cycle: [recipients]} for every job whose next attempt is due."""
+        now = time.time() if now is None else now
+        jobs = {}
+        for cycle, recipient in self.db.execute(
+                "SELECT cycle, recipient FROM jobs WHERE next_attempt_at <= ? ORDER BY created_at", (now,)):
+            jobs.setdefault(cycle, []).append(recipient)
+        return jobs
+
+    def body(self, cycle):
+        return self.db.execute("SELECT body FROM messages WHERE cycle = ?", (cycle,)).fetchone()[0]
+
+    def backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def mark_sent(self, cycle, recipients):
+        with self.db:
+            self.db.executemany("DELETE FROM jobs WHERE cycle = ? AND recipient = ?",
+                                ((cycle, recipient) for recipient in recipients))
+            self._drop_finished(cycle)
+
+    def mark_failed(self, cycle, recipients, now=None):
+        now = time.time() if now is None else now
+        with self.db:
+            for recipient in recipients:
+                attempts = self.db.execute("SELECT attempts FROM jobs WHERE cycle = ? AND recipient = ?",
+                                           (cycle, recipient)).fetchone()[0] + 1
+                if attempts >= self.max_attempts:
+                    logging.critical(f"Giving up on email to {recipient} for cycle {cycle} after {attempts} attempts.")
+                    self.db.execute("DELETE FROM jobs WHERE cycle = ? AND recipient = ?", (cycle, recipient))
+                else:
+                    self.db.execute("UPDATE jobs SET attempts = ?, next_attempt_at = ? WHERE cycle = ? AND recipient = ?",
+                                    (attempts, now + self.backoff(attempts), cycle, recipient))
+            self._drop_finished(cycle)
+
+    def _drop_finished(self, cycle):
+        self.db.execute("DELETE FROM messages WHERE cycle = ? AND NOT EXISTS "
+                        "(SELECT 1 FROM jobs WHERE jobs.cycle = messages.cycle)", (cycle,))
+
+    def depth(self):
+        return self.db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def oldest_age(self, now=None):
+        """Age in seconds of the oldest pending job, or 0 when the outbox is empty."""
+        now = time.time() if now is None else now
+        oldest = self.db.execute("SELECT MIN(created_at) FROM jobs").fetchone()[0]
+        return now - oldest if oldest is not None else 0
+
+    def next_due_in(self, now=None):
+        now = time.time() if now is None else now
+        next_at = self.db.execute("SELECT MIN(next_attempt_at) FROM jobs").fetchone()[0]
+        return max(0, next_at - now) if next_at is not None else None
+
+    def update_gauges(self):
+        metrics.set('email_outbox_depth', self.depth())
+        metrics.set('email_outbox_oldest_age_seconds', self.oldest_age())
+
+    async def run(self, pool, poll_interval=60):
+        """Background worker: delivers due jobs through `pool` without blocking the event loop."""
+        while True:
+            try:
+                for cycle, recipients in self.due().items():
+                    with metrics.timer('send_email'):
+                        sent, failed = await asyncio.to_thread(pool.send, self.body(cycle), recipients)
+                    metrics.inc('emails_sent_total', len(sent))
+                    metrics.inc('emails_failed_total', len(failed))
+                    self.mark_sent(cycle, sent)
+                    if failed:
+                        self.mark_failed(cycle, list(failed))
+                        logging.warning(f"{len(failed)} emails for cycle {cycle} failed; see outbox for retries.")
+            except Exception as e:
+                logging.error(f"Email outbox worker error: {e}")
+            # Refreshed after every pass, so /metrics tracks the queue between scrape cycles.
+            self.update_gauges()
+            next_due = self.next_due_in()
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(),
+                                       poll_interval if next_due is None else min(poll_interval, max(1, next_due)))
+            except asyncio.TimeoutError:
+                pass
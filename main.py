@@ -1,7 +1,5 @@
 import os
 import re
-import json
-import smtplib
 import logging
 import asyncio
 import time
@@ -10,10 +8,24 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 
-from telethon import TelegramClient
+from telethon import TelegramClient, events
+from telethon.errors import (AuthKeyError, ChannelInvalidError, ChannelPrivateError, FloodWaitError,
+                             PeerIdInvalidError, UnauthorizedError)
 from telethon.tl.types import MessageEntityTextUrl, MessageEntityUrl
 from dotenv import load_dotenv
 
+from batcher import MicroBatcher
+from entity_cache import EntityCache
+from metrics import registry as metrics
+from mailer import Outbox, SmtpPool, serialize_message
+from prober import rank_links
+from proxy_links import canonical_key, canonicalize_links
+from publisher import MAX_MESSAGE_LENGTH, TelegramPublisher, pack_chunks
+from scrape_state import FETCHED_AT_KEY, StateStore
+from seen_links import SeenLinkIndex
+from sessions import Session, SessionPool, parse_sessions
+from subscriptions import SubscriptionStore
+
 # --- Configuration & Setup ---
 load_dotenv()
 
@@ -28,7 +40,10 @@ API_ID = os.getenv('API_ID')
 API_HASH = os.getenv('API_HASH')
 CHANNELS_INPUT = os.getenv('TELEGRAM_CHANNELS', '').split(',')
 CHANNELS = [c.strip() for c in CHANNELS_INPUT if c.strip()]
-TARGET_CHAT_ID = int(os.getenv('TARGET_TELEGRAM_CHAT_ID', '0'))
+TARGET_CHAT_IDS = [int(c) for c in os.getenv('TARGET_TELEGRAM_CHAT_ID', '').split(',') if c.strip() and int(c)]
+# Sustained Telegram send rate (messages per second) and burst size, shared by all target chats.
+TELEGRAM_SEND_RATE = float(os.getenv('TELEGRAM_SEND_RATE', 1))
+TELEGRAM_SEND_BURST = int(os.getenv('TELEGRAM_SEND_BURST', 3))
 
 # Email Configuration
 MAIL_HOST = os.getenv('MAIL_HOST')
@@ -38,35 +53,105 @@ MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
 MAIL_FROM_ADDRESS = os.getenv('MAIL_FROM_ADDRESS')
 EMAIL_RECIPIENTS_FILE = 'emails.txt'
 GUIDE_PDF_FILE = 'در صورت وقوع بحران یا جنگ.pdf'
+# Concurrent SMTP connections, and messages sent over one connection before it is recycled.
+MAIL_POOL_SIZE = int(os.getenv('MAIL_POOL_SIZE', 4))
+MAIL_MAX_PER_CONNECTION = int(os.getenv('MAIL_MAX_PER_CONNECTION', 50))
+# Failed deliveries are retried with exponential backoff (plus jitter) up to MAIL_MAX_ATTEMPTS times.
+MAIL_RETRY_BASE_DELAY = int(os.getenv('MAIL_RETRY_BASE_DELAY_SECONDS', 30))
+MAIL_RETRY_MAX_DELAY = int(os.getenv('MAIL_RETRY_MAX_DELAY_SECONDS', 3600))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 20))
 
 # Bot & Storage Configuration
 STORAGE_PATH = os.getenv('PERSISTENT_STORAGE_PATH', './data')
-SESSION_FILE = os.path.join(STORAGE_PATH, 'bot.session')
+# Telegram accounts as 'name[@proxy-url],...', e.g. 'bot,bot2@socks5://127.0.0.1:1080'. Each one
+# logs in with <name>.session in the storage path, and channels are split between them.
+TELEGRAM_SESSIONS = parse_sessions(os.getenv('TELEGRAM_SESSIONS', '')) or [('bot', None)]
+# A session that fails (banned, disconnected, long flood wait) is skipped for this long.
+SESSION_RETRY_SECONDS = int(os.getenv('SESSION_RETRY_SECONDS', 600))
 STATE_FILE = os.path.join(STORAGE_PATH, 'last_message_ids.json')
 RUN_INTERVAL = int(os.getenv('RUN_INTERVAL_SECONDS', 28800))
+OUTBOX_FILE = os.path.join(STORAGE_PATH, 'outbox.sqlite3')
+ENTITY_CACHE_FILE = os.path.join(STORAGE_PATH, 'entities.json')
+# Resolved channel ids/access hashes are reused for this long before being resolved again.
+ENTITY_CACHE_TTL = int(os.getenv('ENTITY_CACHE_TTL_SECONDS', 30 * 86400))
+SEEN_LINKS_FILE = os.path.join(STORAGE_PATH, 'seen_links.sqlite3')
+# Links already published within this period are not published again.
+SEEN_LINKS_TTL = int(os.getenv('SEEN_LINKS_TTL_SECONDS', 14 * 86400))
+
+# Metrics Configuration
+# Prometheus text is served on METRICS_HOST:METRICS_PORT/metrics (0 disables the endpoint).
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+# Optional path for a JSON dump of all metrics after every cycle.
+METRICS_JSON_FILE = os.getenv('METRICS_JSON_FILE', '')
+
+# Subscription Configuration
+# Per-protocol lists and a base64 v2ray subscription are kept in SUBSCRIPTION_DIR and served on
+# http://SUBSCRIPTION_HOST:SUBSCRIPTION_PORT/sub/<protocol> and /sub/v2ray (port 0 disables serving).
+SUBSCRIPTION_DIR = os.path.join(STORAGE_PATH, 'subscriptions')
+SUBSCRIPTION_HOST = os.getenv('SUBSCRIPTION_HOST', '127.0.0.1')
+SUBSCRIPTION_PORT = int(os.getenv('SUBSCRIPTION_PORT', 9109))
+# Newest links kept per protocol.
+SUBSCRIPTION_MAX_LINKS = int(os.getenv('SUBSCRIPTION_MAX_LINKS', 1000))
+
+# Liveness Probe Configuration
+PROBE_ENABLED = os.getenv('PROBE_ENABLED', 'true').strip().lower() in ('1', 'true', 'yes')
+PROBE_CONCURRENCY = int(os.getenv('PROBE_CONCURRENCY', 200))
+PROBE_TIMEOUT = float(os.getenv('PROBE_TIMEOUT_SECONDS', 5))
+# DNS lookups get their own limit; PROBE_TIMEOUT only bounds the TCP connect.
+PROBE_DNS_TIMEOUT = float(os.getenv('PROBE_DNS_TIMEOUT_SECONDS', 5))
+
+# Fetch Configuration
+# 'incremental' resumes each channel from its saved watermark (min_id);
+# 'window' always rescans the last RUN_INTERVAL seconds.
+FETCH_MODE = os.getenv('FETCH_MODE', 'incremental').strip().lower()
+# A watermark older than this is considered stale and the channel falls back to the time window.
+WATERMARK_MAX_GAP = int(os.getenv('WATERMARK_MAX_GAP_SECONDS', RUN_INTERVAL * 3))
+# 'poll' scrapes every RUN_INTERVAL; 'stream' publishes new messages as they arrive.
+SCRAPE_MODE = os.getenv('SCRAPE_MODE', 'poll').strip().lower()
+STREAM_FLUSH_LINKS = int(os.getenv('STREAM_FLUSH_LINKS', 200))
+STREAM_FLUSH_SECONDS = int(os.getenv('STREAM_FLUSH_SECONDS', 300))
+# Channels are scraped concurrently; a channel exceeding the timeout is checkpointed where it got to.
+SCRAPE_CONCURRENCY = max(1, int(os.getenv('SCRAPE_CONCURRENCY', 5)))
+CHANNEL_TIMEOUT = int(os.getenv('CHANNEL_TIMEOUT_SECONDS', 300))
 
 # Regular Expressions for Link Extraction
 REGEX_PATTERNS = {
     "MTPROTO": r"https?://t\.me/proxy\?[^\s]+",
     "VLESS": r"vless://[^\s]+",
     "VMESS": r"vmess://[^\s]+",
-    "SHADOWSOCKS": r"ss://[^\s]+"
+    "SHADOWSOCKS": r"\bss://[^\s]+"
 }
+# All patterns combined into one alternation; the named group that matched is the protocol.
+LINK_REGEX = re.compile(
+    "|".join(f"(?P<{protocol}>{pattern})" for protocol, pattern in REGEX_PATTERNS.items()),
+    re.IGNORECASE
+)
+# Errors that mean the account or its connection is unusable, not the channel.
+SESSION_ERRORS = (AuthKeyError, UnauthorizedError, ConnectionError)
+# Serializes publish_links between streaming flushes and catch-up cycles.
+publish_lock = asyncio.Lock()
 
 
-def load_state():
-    if not os.path.exists(STATE_FILE): return {}
-    try:
-        with open(STATE_FILE, 'r') as f: return json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
-        logging.error(f"Error loading state file: {e}"); return {}
+def entity_cache_path(session_name, first_session):
+    """Access hashes are per account; the first session keeps the original file name."""
+    return ENTITY_CACHE_FILE if first_session else os.path.join(STORAGE_PATH, f'entities.{session_name}.json')
 
-def save_state(state):
-    try:
-        os.makedirs(STORAGE_PATH, exist_ok=True)
-        with open(STATE_FILE, 'w') as f: json.dump(state, f, indent=4)
-    except IOError as e:
-        logging.error(f"Error saving state file: {e}")
+
+def get_fetch_kwargs(state, channel_id_str, now):
+    """Builds the iter_messages arguments for a channel based on its saved watermark.
+
+    Channels with a fresh watermark are resumed with min_id only. New channels, or channels
+    whose watermark is older than WATERMARK_MAX_GAP, fall back to the bounded time window.
+    The window is passed as offset_date alone: with reverse=True Telethon starts from min_id
+    whenever one is given, which would turn a stale watermark into a full backfill, so
+    scrape_channel drops messages at or below the watermark itself.
+    """
+    last_id = state.get(channel_id_str, 0)
+    fetched_at = state.get(FETCHED_AT_KEY, {}).get(channel_id_str)
+    if FETCH_MODE == 'incremental' and last_id and fetched_at and now - fetched_at <= WATERMARK_MAX_GAP:
+        return {'min_id': last_id}
+    return {'offset_date': datetime.utcnow() - timedelta(seconds=RUN_INTERVAL)}
 
 def get_email_recipients():
     if not os.path.exists(EMAIL_RECIPIENTS_FILE): return []
@@ -77,8 +162,8 @@ def get_email_recipients():
         logging.error(f"Could not read recipients file: {e}"); return []
 
 
-def send_email(categorized_links, total_links_found):
-    """Sends an email with an updated, more urgent message and attachments."""
+def queue_email(outbox, categorized_links, total_links_found):
+    """Builds the email with an updated, more urgent message and attachments and queues it in the outbox."""
     recipients = get_email_recipients()
     if not recipients:
         logging.warning("No email recipients found, skipping email."); return
@@ -129,92 +214,297 @@ def send_email(categorized_links, total_links_found):
     else:
         logging.warning(f"Guide PDF file not found at '{GUIDE_PDF_FILE}'. Skipping attachment.")
 
-    max_retries = 300
-    sent_to = set()
+    msg = MIMEMultipart()
+    msg['From'] = MAIL_FROM_ADDRESS
+    msg['Subject'] = subject
+    msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+    for att in attachments:
+        msg.attach(att)
+    if pdf_attachment:
+        msg.attach(pdf_attachment)
+    body = serialize_message(msg)
 
-    for attempt in range(max_retries):
-        remaining_recipients = [r for r in recipients if r not in sent_to]
-        if not remaining_recipients:
-            logging.info("All emails sent successfully.")
-            return
-
-        try:
-            with smtplib.SMTP(MAIL_HOST, MAIL_PORT, timeout=90) as server:
-                server.starttls()
-                server.login(MAIL_USER, MAIL_PASSWORD)
-                
-                for recipient in remaining_recipients:
-                    msg = MIMEMultipart()
-                    msg['From'] = MAIL_FROM_ADDRESS
-                    msg['To'] = recipient
-                    msg['Subject'] = subject
-                    msg.attach(MIMEText(html_body, 'html', 'utf-8'))
-                    
-                    for att in attachments:
-                        msg.attach(att)
-                    if pdf_attachment:
-                        msg.attach(pdf_attachment)
-                    
-                    server.send_message(msg)
-                    logging.info(f"Email successfully sent to {recipient}")
-                    sent_to.add(recipient)
-            
-            logging.info("All emails sent successfully.")
-            return
-
-        except Exception as e:
-            logging.error(f"Email send attempt {attempt + 1}/{max_retries} failed. Reason: {e}")
-            if attempt < max_retries - 1:
-                logging.info("Waiting for 30 seconds before retrying remaining emails...")
-                time.sleep(30)
-            else:
-                logging.critical("All email send attempts have failed.")
+    outbox.enqueue(body, recipients)
 
 
 def extract_links(message):
-    extracted_links = set()
+    """Returns the unique (protocol, link) pairs found in a message's text and URL entities."""
     text = message.text or ""
-    for pattern in REGEX_PATTERNS.values():
-        extracted_links.update(re.findall(pattern, text, re.IGNORECASE))
+    extracted_links = {(m.lastgroup, m.group()) for m in LINK_REGEX.finditer(text)}
     if message.entities:
         for entity in message.entities:
             if isinstance(entity, (MessageEntityTextUrl, MessageEntityUrl)):
                 url = entity.url if isinstance(entity, MessageEntityTextUrl) else text[entity.offset:entity.offset+entity.length]
-                for pattern in REGEX_PATTERNS.values():
-                    if re.match(pattern, url, re.IGNORECASE):
-                        extracted_links.add(url); break
+                match = LINK_REGEX.match(url)
+                if match:
+                    extracted_links.add((match.lastgroup, url))
     return list(extracted_links)
 
-async def send_results_to_telegram_group(client, categorized_links, total_links_found):
-    if not TARGET_CHAT_ID:
+def extract_links_batch(messages):
+    """Extracts links from many messages at once, categorized as {protocol: set(links)}."""
+    categorized_links = {protocol: set() for protocol in REGEX_PATTERNS}
+    for message in messages:
+        for protocol, link in extract_links(message):
+            categorized_links[protocol].add(link)
+    return categorized_links
+
+async def send_results_to_telegram_group(publisher, categorized_links, total_links_found):
+    if not publisher.chat_ids:
         logging.info("TARGET_TELEGRAM_CHAT_ID not set, skipping sending to group.")
         return
 
-    logging.info(f"Sending results to Telegram group ID: {TARGET_CHAT_ID}")
-    try:
-        summary_message = f"✅ **گزارش جدید پروکسی** | **{total_links_found}** لینک جدید"
-        await client.send_message(TARGET_CHAT_ID, summary_message, parse_mode='md')
-        await asyncio.sleep(1)
+    logging.info(f"Sending results to Telegram chats: {publisher.chat_ids}")
+    summary_message = f"✅ **گزارش جدید پروکسی** | **{total_links_found}** لینک جدید"
+    messages = [(summary_message, {'parse_mode': 'md'})]
+
+    for protocol, links in categorized_links.items():
+        if not links: continue
+        link_lines = [f"[proxy{i}]({link})  " if protocol == "MTPROTO" else f"`{link}`\n"
+                      for i, link in enumerate(links, 1)]
+        # Reserve room for the widest possible part header.
+        widest_header = f"**{protocol.upper()} ({len(links)}) - Part {len(links)}/{len(links)}**\n\n"
+        chunks = pack_chunks(link_lines, MAX_MESSAGE_LENGTH - len(widest_header))
+        for i, chunk_content in enumerate(chunks, 1):
+            part_header = f"**{protocol.upper()} ({len(links)}) - Part {i}/{len(chunks)}**\n\n"
+            messages.append((part_header + chunk_content, {'parse_mode': 'md', 'link_preview': False}))
+
+    delivered = await publisher.publish(messages)
+    expected = len(messages) * len(publisher.chat_ids)
+    if delivered == expected:
+        logging.info("Successfully sent all link batches to the Telegram chats.")
+    else:
+        logging.error(f"Only {delivered}/{expected} link batches were delivered to the Telegram chats.")
 
-        MAX_MESSAGE_LENGTH = 4000
+
+async def scrape_channel(client, channel_name, state, now, entity_cache, progress=None):
+    """Scrapes a single channel and returns its id, new watermark and categorized links.
+
+    The shared state is only read here; the caller merges the result so a channel that
+    fails leaves its watermark untouched. Messages arrive oldest first, so `progress` (if
+    given) always holds a usable partial result that the caller can checkpoint when the
+    channel times out. If a cached peer is rejected, the channel is resolved again once
+    before giving up.
+    """
+    progress = {} if progress is None else progress
+    while True:
+        with metrics.timer('get_entity'):
+            channel_peer, from_cache = await entity_cache.resolve(client, channel_name)
+        metrics.inc('entity_cache_lookups_total', result='hit' if from_cache else 'miss')
+        channel_links = {protocol: set() for protocol in REGEX_PATTERNS}
+        channel_id_str = str(channel_peer.channel_id)
+        fetch_kwargs = get_fetch_kwargs(state, channel_id_str, now)
+        if 'offset_date' in fetch_kwargs:
+            logging.info(f"Channel {channel_name}: no fresh watermark, scanning the time window.")
+
+        last_id = state.get(channel_id_str, 0)
+        # The time window is not bounded by min_id (see get_fetch_kwargs), so skip what was seen.
+        skip_through = last_id if FETCH_MODE == 'incremental' else 0
+        progress.update(channel_id_str=channel_id_str, last_id=last_id, links=channel_links)
+        scanned, extract_time, fetch_started = 0, 0.0, time.perf_counter()
+        try:
+            async for message in client.iter_messages(channel_peer, reverse=True, **fetch_kwargs):
+                if message.id <= skip_through:
+                    continue
+                extract_started = time.perf_counter()
+                for protocol, link in extract_links(message):
+                    channel_links[protocol].add(link)
+                extract_time += time.perf_counter() - extract_started
+                last_id = progress['last_id'] = max(last_id, message.id)
+                scanned += 1
+        except (ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError, ValueError):
+            entity_cache.invalidate(channel_name)
+            if from_cache: continue
+            raise
+        finally:
+            metrics.observe('stage_seconds', time.perf_counter() - fetch_started - extract_time, stage='iter_messages')
+            metrics.observe('stage_seconds', extract_time, stage='extract_links')
+            metrics.inc('messages_scanned_total', scanned)
+        return channel_id_str, last_id, channel_links
+
+async def scrape_channels(pool, state_store, entity_caches):
+    """Scrapes all channels concurrently and checkpoints each one's links and watermark.
+
+    Each channel is scraped by the session that owns it (see SessionPool); if that session
+    fails, the channel moves to its next-ranked healthy session within the same cycle. At
+    most SCRAPE_CONCURRENCY channels per session are in flight at once and each one is bounded
+    by CHANNEL_TIMEOUT, so a slow or failing channel does not hold up the others. All sessions
+    checkpoint into the same state store. Returns every link not yet published, including
+    those left over from an interrupted cycle.
+    """
+    state = state_store.state
+    semaphores = {session.name: asyncio.Semaphore(SCRAPE_CONCURRENCY) for session in pool}
+    channel_times = {}
+    now = time.time()
+    logging.info(f"Fetch mode: {FETCH_MODE} (window fallback: last {int(RUN_INTERVAL / 3600)} hours), "
+                 f"concurrency: {SCRAPE_CONCURRENCY} per session, sessions: {[s.name for s in pool.alive()]}.")
+
+    async def worker(channel_name):
+        tried = set()
+        while True:
+            session = next((s for s in pool.candidates(channel_name) if s.name not in tried), None)
+            if session is None:
+                logging.error(f"No healthy Telegram session left to scrape channel {channel_name}.")
+                return
+            tried.add(session.name)
+            async with semaphores[session.name]:
+                started, progress = time.perf_counter(), {}
+                try:
+                    channel_id_str, last_id, channel_links = await asyncio.wait_for(
+                        scrape_channel(session.client, channel_name, state, now, entity_caches[session.name],
+                                       progress),
+                        timeout=CHANNEL_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logging.error(f"Timed out processing channel {channel_name} after {CHANNEL_TIMEOUT} seconds.")
+                    if progress.get('last_id', 0) > state.get(progress.get('channel_id_str'), 0):
+                        # Keep what was scanned; the next cycle resumes from here.
+                        state_store.checkpoint(progress['channel_id_str'], progress['last_id'], now, progress['links'])
+                        logging.info(f"Channel {channel_name}: checkpointed partial progress up to message "
+                                     f"{progress['last_id']}.")
+                    return
+                except FloodWaitError as e:
+                    pool.mark_failed(session, f"flood wait of {e.seconds}s", e.seconds)
+                    metrics.inc('session_failovers_total', session=session.name)
+                    continue
+                except SESSION_ERRORS as e:
+                    pool.mark_failed(session, e)
+                    metrics.inc('session_failovers_total', session=session.name)
+                    continue
+                except Exception as e:
+                    logging.error(f"Error processing channel {channel_name}: {e}")
+                    return
+                finally:
+                    channel_times[channel_name] = time.perf_counter() - started
+
+            state_store.checkpoint(channel_id_str, last_id, now, channel_links)
+            logging.info(f"Channel {channel_name}: {sum(len(l) for l in channel_links.values())} links "
+                         f"in {channel_times[channel_name]:.2f}s via session {session.name}.")
+            return
+
+    cycle_started = time.perf_counter()
+    await asyncio.gather(*(worker(channel_name) for channel_name in CHANNELS))
+    wall_time = time.perf_counter() - cycle_started
+    logging.info(f"Scraped {len(CHANNELS)} channels in {wall_time:.2f}s wall-clock "
+                 f"(sum of per-channel times: {sum(channel_times.values()):.2f}s).")
+    all_new_links = {protocol: set() for protocol in REGEX_PATTERNS}
+    for protocol, links in state_store.pending_links().items():
+        all_new_links[protocol].update(links)
+    return all_new_links
+
+
+async def publish_links(all_new_links, seen_index, outbox, publisher, subscriptions):
+    """Drops already-published links, probes the rest and hands them to the subscription
+    feeds, email and Telegram.
+
+    Links are only recorded in the seen index once the email is queued and the Telegram
+    report has been sent, so links from a cycle that crashes or fails midway are published
+    again rather than lost. Calls are serialized, since streaming flushes and catch-up cycles
+    would otherwise both publish a link neither has recorded yet.
+    """
+    async with publish_lock:
+        await _publish_links(all_new_links, seen_index, outbox, publisher, subscriptions)
+
+async def _publish_links(all_new_links, seen_index, outbox, publisher, subscriptions):
+    seen_index.evict()
+    total_found = sum(len(links) for links in all_new_links.values())
+    # The same server posted with another #remark, parameter order or trailing emoji is one link.
+    for protocol, links in all_new_links.items():
+        metrics.inc('links_found_total', len(links), protocol=protocol)
+    all_new_links = canonicalize_links(all_new_links)
+    total_canonical = sum(len(links) for links in all_new_links.values())
+    logging.info(f"Canonicalized {total_found} links down to {total_canonical} distinct servers.")
+    all_new_links = seen_index.filter_new(all_new_links)
+    total_new_links = sum(len(links) for links in all_new_links.values())
+    metrics.inc('duplicates_dropped_total', total_found - total_canonical, reason='canonical')
+    metrics.inc('duplicates_dropped_total', total_canonical - total_new_links, reason='already_published')
+    logging.info(f"Dropped {total_canonical - total_new_links} links that were already published. "
+                 f"Index size per protocol: {seen_index.counts()}")
+    if total_new_links > 0 and PROBE_ENABLED:
+        # Unreachable links are not recorded, so they can still be published once they come back.
+        try:
+            with metrics.timer('probe'):
+                categorized_links = await rank_links(all_new_links, PROBE_CONCURRENCY, PROBE_TIMEOUT, PROBE_DNS_TIMEOUT)
+        except Exception as e:
+            # A probe bug must not block publishing (or replay the same pending links forever).
+            logging.error(f"Liveness probing failed, publishing the links unranked. Reason: {e}")
+            categorized_links = {protocol: sorted(links) for protocol, links in all_new_links.items()}
+    else:
+        categorized_links = {protocol: sorted(links) for protocol, links in all_new_links.items()}
+    total_new_links = sum(len(links) for links in categorized_links.values())
+
+    if total_new_links > 0:
+        logging.info(f"Found a total of {total_new_links} new unique links.")
         for protocol, links in categorized_links.items():
-            if not links: continue
-            chunks, current_chunk, link_counter = [], "", 1
-            for link in links:
-                link_line = f"[proxy{link_counter}]({link})  " if protocol == "MTPROTO" else f"`{link}`\n"
-                if protocol == "MTPROTO": link_counter += 1
-                if len(current_chunk) + len(link_line) > MAX_MESSAGE_LENGTH:
-                    chunks.append(current_chunk); current_chunk = ""
-                current_chunk += link_line
-            if current_chunk: chunks.append(current_chunk)
-
-            for i, chunk_content in enumerate(chunks, 1):
-                part_header = f"**{protocol.upper()} ({len(links)}) - Part {i}/{len(chunks)}**\n\n"
-                await client.send_message(TARGET_CHAT_ID, part_header + chunk_content, parse_mode='md', link_preview=False)
-                await asyncio.sleep(1)
-        logging.info("Successfully sent all link batches to the Telegram group.")
-    except Exception as e:
-        logging.error(f"Could not send messages to Telegram group. Reason: {e}")
+            metrics.inc('links_published_total', len(links), protocol=protocol)
+        with metrics.timer('update_subscriptions'):
+            subscriptions.add(categorized_links)
+        with metrics.timer('queue_email'):
+            queue_email(outbox, categorized_links, total_new_links)
+        with metrics.timer('send_results_to_telegram_group'):
+            await send_results_to_telegram_group(publisher, categorized_links, total_new_links)
+        seen_index.mark_published(categorized_links)
+    else:
+        logging.info("No new links found.")
+    outbox.update_gauges()
+    logging.info(f"Email outbox: {outbox.depth()} pending jobs, oldest {int(outbox.oldest_age())}s old.")
+
+async def run_cycle(pool, state_store, entity_caches, seen_index, outbox, publisher, subscriptions):
+    """One polling cycle: scrape every channel from its watermark, publish, then commit the state."""
+    logging.info("Starting new scrape cycle...")
+    with metrics.timer('cycle'):
+        all_new_links = await scrape_channels(pool, state_store, entity_caches)
+        await publish_links(all_new_links, seen_index, outbox, publisher, subscriptions)
+        state_store.commit()
+    metrics.inc('cycles_total')
+    if METRICS_JSON_FILE:
+        metrics.dump_json(METRICS_JSON_FILE)
+
+async def stream_messages(pool, state_store, entity_caches, seen_index, outbox, publisher, subscriptions):
+    """Streaming mode: publishes links as they are posted instead of once per RUN_INTERVAL.
+
+    A NewMessage handler feeds a micro-batcher that flushes every STREAM_FLUSH_LINKS links or
+    STREAM_FLUSH_SECONDS seconds. Streamed messages never move the saved watermarks: updates
+    can be dropped or arrive out of order, so only the catch-up cycle, which runs at startup
+    and every RUN_INTERVAL, advances them after reading each channel's history in order. Links
+    it finds again are dropped by the seen index, so switching between polling and streaming
+    loses and repeats nothing. Each session listens to the channels it owns at startup.
+    """
+    state = state_store.state
+
+    async def flush(links):
+        await publish_links(links, seen_index, outbox, publisher, subscriptions)
+
+    batcher = MicroBatcher(flush, STREAM_FLUSH_LINKS, STREAM_FLUSH_SECONDS)
+    channel_entities = {}
+    for session_name, channel_names in pool.assign(CHANNELS).items():
+        session = pool.sessions[session_name]
+        for channel_name in channel_names:
+            try:
+                peer = (await entity_caches[session_name].resolve(session.client, channel_name))[0]
+                channel_entities.setdefault(session_name, []).append(peer)
+            except Exception as e:
+                logging.error(f"Could not resolve channel {channel_name} with session {session_name}: {e}")
+
+    async def on_new_message(event):
+        message = event.message
+        channel_id_str = str(message.peer_id.channel_id)
+        # Anything at or below the watermark was already covered by a catch-up cycle.
+        if message.id <= state.get(channel_id_str, 0):
+            return
+        await batcher.add(extract_links(message))
+
+    for session_name, peers in channel_entities.items():
+        pool.sessions[session_name].client.add_event_handler(on_new_message, events.NewMessage(chats=peers))
+    logging.info(f"Streaming new messages from {sum(map(len, channel_entities.values()))} channels "
+                 f"(flush every {STREAM_FLUSH_LINKS} links or {STREAM_FLUSH_SECONDS}s).")
+    batcher_task = asyncio.create_task(batcher.run())
+    try:
+        while True:
+            await run_cycle(pool, state_store, entity_caches, seen_index, outbox, publisher, subscriptions)
+            logging.info(f"Catch-up cycle finished. Next one in {int(RUN_INTERVAL / 3600)} hours...")
+            await asyncio.sleep(RUN_INTERVAL)
+    finally:
+        batcher_task.cancel()
+        await batcher.flush()
 
 
 async def main_task():
@@ -228,50 +518,47 @@ async def main_task():
     except OSError as e:
         logging.critical(f"Could not create storage directory at {STORAGE_PATH}. Error: {e}"); return
 
-    client = TelegramClient(SESSION_FILE, API_ID, API_HASH)
-
-    try:
-        await client.start()
-        logging.info("Telegram client started successfully.")
-    except Exception as e:
-        logging.critical(f"Failed to start Telegram client: {e}"); return
+    state_store = StateStore(STATE_FILE)
+    seen_index = SeenLinkIndex(SEEN_LINKS_FILE, SEEN_LINKS_TTL, key_func=canonical_key)
+    outbox = Outbox(OUTBOX_FILE, MAIL_RETRY_BASE_DELAY, MAIL_RETRY_MAX_DELAY, MAIL_MAX_ATTEMPTS)
+    subscriptions = SubscriptionStore(SUBSCRIPTION_DIR, REGEX_PATTERNS, SUBSCRIPTION_MAX_LINKS)
+    smtp_pool = SmtpPool(MAIL_HOST, MAIL_PORT, MAIL_USER, MAIL_PASSWORD, MAIL_FROM_ADDRESS,
+                         pool_size=MAIL_POOL_SIZE, max_per_connection=MAIL_MAX_PER_CONNECTION)
+    sessions, entity_caches = [], {}
+    for i, (session_name, proxy) in enumerate(TELEGRAM_SESSIONS):
+        client = TelegramClient(os.path.join(STORAGE_PATH, f'{session_name}.session'), API_ID, API_HASH, proxy=proxy)
+        try:
+            await client.start()
+            logging.info(f"Telegram client {session_name} started successfully.")
+        except Exception as e:
+            logging.error(f"Failed to start Telegram client {session_name}: {e}"); continue
+        sessions.append(Session(session_name, client))
+        entity_caches[session_name] = EntityCache(entity_cache_path(session_name, i == 0), ENTITY_CACHE_TTL)
+    if not sessions:
+        logging.critical("No Telegram client could be started. Exiting."); return
+    pool = SessionPool(sessions, SESSION_RETRY_SECONDS)
+
+    # Reports are always sent from one account so they keep a single sender in the target chats.
+    publisher = TelegramPublisher(sessions[0].client, TARGET_CHAT_IDS, TELEGRAM_SEND_RATE, TELEGRAM_SEND_BURST)
+    if METRICS_PORT:
+        try:
+            await metrics.serve(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            logging.error(f"Could not start metrics endpoint on {METRICS_HOST}:{METRICS_PORT}: {e}")
+    if SUBSCRIPTION_PORT:
+        try:
+            await subscriptions.serve(SUBSCRIPTION_HOST, SUBSCRIPTION_PORT)
+        except OSError as e:
+            logging.error(f"Could not start subscription endpoint on {SUBSCRIPTION_HOST}:{SUBSCRIPTION_PORT}: {e}")
+    # Email is delivered in the background so SMTP outages never stall scraping or Telegram.
+    outbox_worker = asyncio.create_task(outbox.run(smtp_pool))
+
+    if SCRAPE_MODE == 'stream':
+        await stream_messages(pool, state_store, entity_caches, seen_index, outbox, publisher, subscriptions)
+        return
 
     while True:
-        logging.info("Starting new scrape cycle...")
-        state = load_state() 
-        all_new_links = {protocol: set() for protocol in REGEX_PATTERNS}
-        
-        time_offset_hours = RUN_INTERVAL / 3600
-        offset_date = datetime.utcnow() - timedelta(hours=time_offset_hours)
-        logging.info(f"Fetching all messages from the last {int(time_offset_hours)} hours.")
-        
-        for channel_name in CHANNELS:
-            try:
-                channel_entity = await client.get_entity(channel_name)
-                channel_id_str = str(channel_entity.id)
-                
-                async for message in client.iter_messages(channel_entity, offset_date=offset_date, reverse=True):
-                    links = extract_links(message)
-                    if links:
-                        for link in links:
-                            for protocol, pattern in REGEX_PATTERNS.items():
-                                if re.match(pattern, link, re.IGNORECASE):
-                                    all_new_links[protocol].add(link); break
-                    state[channel_id_str] = max(state.get(channel_id_str, 0), message.id)
-            except Exception as e:
-                logging.error(f"Error processing channel {channel_name}: {e}")
-
-        total_new_links = sum(len(links) for links in all_new_links.values())
-        if total_new_links > 0:
-            logging.info(f"Found a total of {total_new_links} new unique links.")
-            categorized_links = {protocol: sorted(list(links)) for protocol, links in all_new_links.items()}
-            
-            send_email(categorized_links, total_new_links)
-            await send_results_to_telegram_group(client, categorized_links, total_new_links)
-        else:
-            logging.info("No new links found in this cycle.")
-
-        save_state(state)
+        await run_cycle(pool, state_store, entity_caches, seen_index, outbox, publisher, subscriptions)
         logging.info(f"Scrape cycle finished. Waiting for {int(RUN_INTERVAL / 3600)} hours...")
         await asyncio.sleep(RUN_INTERVAL)
 
@@ -0,0 +1,109 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+
+from telethon.errors import FileReferenceExpiredError, FileReferenceInvalidError, MediaEmptyError
+from telethon.tl.types import InputPhoto
+
+from scrape_state import atomic_write_json
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class MediaCache:
+    """Persistent map of local image path -> the Telegram photo it was uploaded as.
+
+    The first send of an image uploads it; the photo's id, access hash and file reference are
+    then saved, and every later send (in this run or the next) reuses the photo without
+    uploading a byte. An entry is dropped when the file's SHA-256 changes or when Telegram
+    rejects its file reference, and the image is then uploaded again. Photos are per account,
+    so each session needs its own cache file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        # path -> (mtime, size, digest), so unchanged files are not re-hashed for every user.
+        self.digests = {}
+        # path -> lock held while that image is being uploaded.
+        self.upload_locks = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f: self.entries = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logging.error(f"Error loading media cache, starting empty: {e}")
+
+    def save(self):
+        try:
+            atomic_write_json(self.path, self.entries)
+        except IOError as e:
+            logging.error(f"Error saving media cache: {e}")
+
+    def digest(self, file_path):
+        stat = os.stat(file_path)
+        cached = self.digests.get(file_path)
+        if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        digest = file_digest(file_path)
+        self.digests[file_path] = (stat.st_mtime, stat.st_size, digest)
+        return digest
+
+    def get(self, file_path):
+        """Returns the cached InputPhoto for `file_path`, or None if it must be uploaded."""
+        entry = self.entries.get(file_path)
+        if entry and entry['sha256'] == self.digest(file_path):
+            return InputPhoto(entry['id'], entry['access_hash'], bytes.fromhex(entry['file_reference']))
+        return None
+
+    def invalidate(self, file_paths):
+        if any([self.entries.pop(file_path, None) is not None for file_path in file_paths]):
+            self.save()
+
+    async def send_file(self, client, entity, file_paths, **kwargs):
+        """Sends `file_paths` as one album like client.send_file, uploading only uncached images.
+
+        Concurrent senders of an uncached image wait for the first one's upload to be cached
+        and then send it by reference, so each image is uploaded once per session.
+        """
+        while True:
+            files = [self.get(file_path) or file_path for file_path in file_paths]
+            missing = sorted({file_path for file_path, file in zip(file_paths, files) if isinstance(file, str)})
+            async with contextlib.AsyncExitStack() as uploading:
+                # Sorted, so two albums sharing images cannot lock them in opposite orders.
+                for file_path in missing:
+                    await uploading.enter_async_context(self.upload_locks.setdefault(file_path, asyncio.Lock()))
+                if missing:
+                    # Another sender may have uploaded them while we waited.
+                    files = [self.get(file_path) or file_path for file_path in file_paths]
+                uploaded = [file_path for file_path, file in zip(file_paths, files) if isinstance(file, str)]
+                if not uploaded:
+                    await uploading.aclose()
+                try:
+                    result = await client.send_file(entity, files if len(files) > 1 else files[0], **kwargs)
+                except (FileReferenceExpiredError, FileReferenceInvalidError, MediaEmptyError) as e:
+                    if len(uploaded) == len(file_paths):
+                        raise
+                    logging.warning(f"Cached media was rejected ({e}); uploading the guide images again.")
+                    self.invalidate(file_paths)
+                    continue
+
+                messages = result if isinstance(result, list) else [result]
+                if uploaded:
+                    for file_path, message in zip(file_paths, messages):
+                        photo = getattr(message, 'photo', None)
+                        if file_path in uploaded and photo:
+                            self.entries[file_path] = {'sha256': self.digest(file_path), 'id': photo.id,
+                                                       'access_hash': photo.access_hash,
+                                                       'file_reference': photo.file_reference.hex()}
+                    self.save()
+                    logging.info(f"Uploaded and cached {len(uploaded)} media files.")
+                return result
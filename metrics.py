@@ -0,0 +1,110 @@
+import json
+import time
+from contextlib import contextmanager
+
+from httpd import start_http_server
+
+# Upper bounds in seconds; covers a sub-millisecond extraction up to a multi-minute channel scan.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, float('inf'))
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+def _label_str(labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}" if labels else ""
+
+
+class Registry:
+    """In-process counters, gauges and histograms, cheap enough to leave on in production.
+
+    Everything is a dict lookup and an addition on the event-loop thread; rendering only
+    happens when the metrics endpoint is scraped or a cycle dumps its JSON.
+    """
+
+    def __init__(self, prefix='libertad_'):
+        self.prefix = prefix
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage):
+        """Records the duration of the enclosed block under stage_seconds{stage=...}."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - started, stage=stage)
+
+    def render_prometheus(self):
+        lines = []
+        for kind, series in (('counter', self.counters), ('gauge', self.gauges)):
+            for name in sorted({name for name, _ in series}):
+                lines.append(f"# TYPE {self.prefix}{name} {kind}")
+                lines += [f"{self.prefix}{name}{_label_str(labels)} {value}"
+                          for (series_name, labels), value in sorted(series.items()) if series_name == name]
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {self.prefix}{name} histogram")
+            for (series_name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if series_name != name: continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append(f"{self.prefix}{name}_bucket{_label_str(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{self.prefix}{name}_sum{_label_str(labels)} {histogram.sum}")
+                lines.append(f"{self.prefix}{name}_count{_label_str(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """A JSON-serializable view of every metric."""
+        def series_name(name, labels):
+            return name + _label_str(labels)
+        return {
+            'timestamp': time.time(),
+            'counters': {series_name(*key): value for key, value in self.counters.items()},
+            'gauges': {series_name(*key): value for key, value in self.gauges.items()},
+            'histograms': {series_name(*key): {'count': h.count, 'sum': h.sum} for key, h in self.histograms.items()},
+        }
+
+    def dump_json(self, path):
+        with open(path, 'w') as f: json.dump(self.snapshot(), f, indent=4)
+
+    async def serve(self, host, port):
+        """Exposes the registry as Prometheus text on http://host:port/metrics."""
+        async def handler(method, path, headers):
+            if path != '/metrics':
+                return 404, {}, b""
+            return 200, {'Content-Type': 'text/plain; version=0.0.4'}, self.render_prometheus().encode()
+        return await start_http_server(host, port, handler)
+
+
+registry = Registry()
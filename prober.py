@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import socket
+import time
+
+from proxy_links import parse_endpoint
+
+
+async def resolve_host(host, port, timeout):
+    """Resolves host to one IP address, or None if it cannot be resolved within `timeout`."""
+    try:
+        infos = await asyncio.wait_for(
+            asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM), timeout=timeout)
+    except (OSError, ValueError, asyncio.TimeoutError):
+        # ValueError covers UnicodeError from IDNA encoding, e.g. 'a..b.com' or a label over 63 chars.
+        return None
+    return infos[0][4][0] if infos else None
+
+
+async def probe_endpoint(address, port, timeout):
+    """Opens a TCP connection to an IP address and returns the connect latency in seconds, or None.
+
+    `address` must already be resolved, so DNS time (and waiting for a resolver thread) is
+    neither measured nor counted against `timeout`.
+    """
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout=timeout)
+    except (OSError, ValueError, asyncio.TimeoutError):
+        return None
+    latency = time.perf_counter() - started
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return latency
+
+
+async def probe_endpoints(endpoints, concurrency, timeout, dns_timeout=None):
+    """Probes each distinct endpoint once with at most `concurrency` lookups or connects in flight.
+
+    Every distinct host is resolved first, bounded by `dns_timeout` (default: `timeout`); only
+    the TCP connect is then timed. Returns {(host, port): latency or None}.
+    """
+    dns_timeout = timeout if dns_timeout is None else dns_timeout
+    semaphore = asyncio.Semaphore(concurrency)
+    endpoints = set(endpoints)
+
+    async def resolve(host, port):
+        async with semaphore:
+            return host, await resolve_host(host, port, dns_timeout)
+
+    addresses = dict(await asyncio.gather(*(resolve(host, port) for host, port in
+                                            {host: port for host, port in endpoints}.items())))
+
+    async def probe(endpoint):
+        host, port = endpoint
+        if addresses[host] is None:
+            return endpoint, None
+        async with semaphore:
+            return endpoint, await probe_endpoint(addresses[host], port, timeout)
+
+    return dict(await asyncio.gather(*(probe(endpoint) for endpoint in endpoints)))
+
+
+async def rank_links(categorized_links, concurrency=200, timeout=5.0, dns_timeout=None):
+    """Drops links whose endpoint is unreachable and sorts the rest by connect latency.
+
+    Links whose endpoint cannot be parsed are kept, after the ranked ones, since there is
+    no evidence that they are dead.
+    """
+    endpoints = {}
+    for protocol, links in categorized_links.items():
+        for link in links:
+            endpoints[(protocol, link)] = parse_endpoint(protocol, link)
+
+    started = time.perf_counter()
+    latencies = await probe_endpoints(
+        [endpoint for endpoint in endpoints.values() if endpoint], concurrency, timeout, dns_timeout)
+    reachable = sum(1 for latency in latencies.values() if latency is not None)
+    logging.info(f"Probed {len(latencies)} endpoints in {time.perf_counter() - started:.2f}s: "
+                 f"{reachable} reachable, {len(latencies) - reachable} unreachable.")
+
+    ranked_links = {}
+    for protocol, links in categorized_links.items():
+        ranked, unparsed = [], []
+        for link in links:
+            endpoint = endpoints[(protocol, link)]
+            if endpoint is None:
+                unparsed.append(link)
+            elif latencies[endpoint] is not None:
+                ranked.append((latencies[endpoint], link))
+        ranked.sort(key=lambda item: item[0])
+        ranked_links[protocol] = [link for _, link in ranked] + unparsed
+    return ranked_links
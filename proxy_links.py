@@ -0,0 +1,126 @@
+import base64
+import binascii
+import json
+import re
+import unicodedata
+from typing import NamedTuple, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+# ASCII characters that end up glued to links from markdown or prose, e.g. `**link**`,
+# `(link)` or `link,`. '=', '/', '_' and '-' are left alone since base64 and paths end in them.
+TRAILING_JUNK = set(")]}>*`~'\".,;:!?|")
+# VMess JSON fields that describe the display name only, not the server.
+VMESS_COSMETIC_FIELDS = {"ps", "v"}
+HEX_SECRET = re.compile(r"[0-9a-fA-F]+")
+
+
+class ProxyRecord(NamedTuple):
+    """Canonical, hashable description of a proxy server; remarks/tags are not part of it."""
+    protocol: str
+    host: str
+    port: int
+    credential: str
+    params: Tuple[Tuple[str, str], ...] = ()
+
+
+def b64decode_loose(data):
+    """Decodes standard or URL-safe base64 with or without padding."""
+    data = data.strip().replace('-', '+').replace('_', '/')
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def clean_link(link):
+    """Strips trailing markdown, punctuation and emoji that the `[^\\s]+` patterns capture."""
+    end = len(link)
+    while end:
+        char = link[end - 1]
+        if char in TRAILING_JUNK or (ord(char) > 127 and unicodedata.category(char)[0] in 'SPMC'):
+            end -= 1
+        else:
+            break
+    return link[:end]
+
+
+def _host_port(netloc):
+    """Splits 'host:port' / '[v6]:port' from a netloc, dropping any userinfo."""
+    parts = urlsplit(f"//{netloc.rpartition('@')[2]}")
+    return parts.hostname, parts.port
+
+
+def _sorted_params(query):
+    return tuple(sorted((key.lower(), value) for key, value in parse_qsl(query, keep_blank_values=True)))
+
+
+def _mtproto_secret(secret):
+    """Hex secrets are case-insensitive; base64-encoded ones are not."""
+    return secret.lower() if HEX_SECRET.fullmatch(secret) else secret
+
+
+def parse_record(protocol, link):
+    """Parses a proxy link into a ProxyRecord, or returns None if it cannot be parsed."""
+    try:
+        link = clean_link(link)
+        if protocol == "MTPROTO":
+            query = dict(parse_qsl(urlsplit(link).query))
+            record = ProxyRecord(protocol, query['server'].lower(), int(query['port']), _mtproto_secret(query['secret']))
+        elif protocol == "VLESS":
+            parts = urlsplit(link)
+            host, port = _host_port(parts.netloc)
+            record = ProxyRecord(protocol, host, port, unquote(parts.username or '').lower(), _sorted_params(parts.query))
+        elif protocol == "VMESS":
+            body = link[len("vmess://"):].split('#', 1)[0]
+            if '@' in body:
+                parts = urlsplit(link)
+                host, port = _host_port(parts.netloc)
+                record = ProxyRecord(protocol, host, port, unquote(parts.username or '').lower(), _sorted_params(parts.query))
+            else:
+                config = json.loads(b64decode_loose(body))
+                params = tuple(sorted((key, str(value)) for key, value in config.items()
+                                      if key not in VMESS_COSMETIC_FIELDS | {"add", "port", "id"} and value not in ("", None)))
+                record = ProxyRecord(protocol, str(config['add']).lower(), int(config['port']),
+                                     str(config['id']).lower(), params)
+        elif protocol == "SHADOWSOCKS":
+            parts = urlsplit(link)
+            netloc = parts.netloc
+            if '@' not in netloc:
+                # Legacy form: ss://base64(method:password@host:port)#tag
+                netloc = b64decode_loose(unquote(netloc)).decode('utf-8')
+            userinfo = unquote(netloc.rpartition('@')[0])
+            if ':' not in userinfo:
+                # SIP002 form: ss://base64url(method:password)@host:port
+                userinfo = b64decode_loose(userinfo).decode('utf-8')
+            host, port = _host_port(netloc)
+            record = ProxyRecord(protocol, host, port, userinfo, _sorted_params(parts.query))
+        else:
+            return None
+    except (KeyError, IndexError, ValueError, TypeError, AttributeError, binascii.Error, UnicodeDecodeError):
+        return None
+    if not record.host or not record.port or not 0 < record.port < 65536:
+        return None
+    return record._replace(host=record.host.lower())
+
+
+def parse_endpoint(protocol, link):
+    """Returns the (host, port) a proxy link connects to, or None if it cannot be parsed."""
+    record = parse_record(protocol, link)
+    return (record.host, record.port) if record else None
+
+
+def canonical_key(protocol, link):
+    """Deduplication key: the parsed record, or the cleaned link without its #remark."""
+    record = parse_record(protocol, link)
+    if record:
+        return "|".join((record.protocol, record.host, str(record.port), record.credential,
+                         "&".join(f"{key}={value}" for key, value in record.params)))
+    return f"{protocol}|{clean_link(link).split('#', 1)[0]}"
+
+
+def canonicalize_links(categorized_links):
+    """Cleans every link and keeps one link per canonical key, preserving first-seen order."""
+    canonical_links = {}
+    for protocol, links in categorized_links.items():
+        by_key = {}
+        for link in links:
+            by_key.setdefault(canonical_key(protocol, link), clean_link(link))
+        canonical_links[protocol] = list(by_key.values())
+    return canonical_links
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+
+from telethon.errors import FloodWaitError
+
+from metrics import registry as metrics
+
+# Telegram rejects messages longer than this many characters.
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Async token bucket: allows bursts of `capacity` sends, refilled at `rate` tokens per second.
+
+    `pause` empties the bucket and blocks every caller until a flood wait has passed.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class AdaptiveRateLimiter:
+    """Spaces sends at least `interval` seconds apart, adapting the interval AIMD-style.
+
+    Every successful send shortens the interval by `speedup` down to `min_interval`; a flood
+    error multiplies it by `backoff` up to `max_interval` and blocks every caller for the
+    penalty Telegram asked for.
+    """
+
+    def __init__(self, interval, min_interval, max_interval, speedup=0.95, backoff=2.0):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.speedup = speedup
+        self.backoff = backoff
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now >= self.next_slot:
+                    self.next_slot = now + self.interval
+                    return
+                await asyncio.sleep(self.next_slot - now)
+
+    def success(self):
+        self.interval = max(self.min_interval, self.interval * self.speedup)
+
+    def flood(self, seconds=0):
+        self.interval = min(self.max_interval, self.interval * self.backoff)
+        self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+
+def pack_chunks(lines, limit):
+    """Greedily packs lines into as few chunks as possible, each at most `limit` characters.
+
+    A single line longer than `limit` is truncated rather than dropped.
+    """
+    chunks, current_chunk = [], ""
+    for line in lines:
+        if len(current_chunk) + len(line) > limit and current_chunk:
+            chunks.append(current_chunk); current_chunk = ""
+        current_chunk += line[:limit]
+    if current_chunk: chunks.append(current_chunk)
+    return chunks
+
+
+class TelegramPublisher:
+    """Sends messages to one or more chats through a shared token-bucket rate limiter.
+
+    A FloodWaitError pauses all sends for the requested time and the same message is then
+    retried, so a flood wait never drops the rest of a report. Other errors are retried up to
+    `max_retries` times before that one message is skipped.
+    """
+
+    def __init__(self, client, chat_ids, rate=1.0, burst=3, max_retries=3, max_flood_wait=3600):
+        self.client = client
+        self.chat_ids = list(chat_ids)
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.max_flood_wait = max_flood_wait
+        self.flood_waits = 0
+
+    async def send(self, chat_id, text, **kwargs):
+        """Sends one message, honouring flood waits; returns True on success."""
+        failures = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.client.send_message(chat_id, text, **kwargs)
+                metrics.inc('telegram_messages_sent_total')
+                return True
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                metrics.inc('telegram_flood_waits_total')
+                metrics.inc('telegram_flood_wait_seconds_total', e.seconds)
+                if e.seconds > self.max_flood_wait:
+                    logging.error(f"Flood wait of {e.seconds}s for chat {chat_id} exceeds the limit. Dropping message.")
+                    return False
+                logging.warning(f"Flood wait triggered for chat {chat_id}. Pausing for {e.seconds} seconds...")
+                self.bucket.pause(e.seconds + 1)
+            except Exception as e:
+                failures += 1
+                if failures >= self.max_retries:
+                    logging.error(f"Could not send message to chat {chat_id} after {failures} attempts. Reason: {e}")
+                    metrics.inc('telegram_messages_failed_total')
+                    return False
+                logging.warning(f"Send to chat {chat_id} failed ({failures}/{self.max_retries}). Reason: {e}")
+
+    async def publish(self, messages):
+        """Sends `messages` ([(text, kwargs)]) in order to every target chat; chats run concurrently.
+
+        Returns the number of messages delivered.
+        """
+        async def publish_to(chat_id):
+            return sum([await self.send(chat_id, text, **kwargs) for text, kwargs in messages])
+
+        return sum(await asyncio.gather(*(publish_to(chat_id) for chat_id in self.chat_ids)))
@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+
+FETCHED_AT_KEY = '_fetched_at'
+PENDING_KEY = '_pending'
+JOURNAL_SEQ_KEY = '_journal_seq'
+
+
+def atomic_write_json(path, data, **kwargs):
+    """Writes JSON to a temp file, fsyncs it and renames it over `path`."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class StateStore:
+    """Crash-safe scrape state: per-channel watermarks plus links not yet published.
+
+    Every finished channel is appended to a journal (one fsynced JSON line per checkpoint), so
+    a crash mid-cycle keeps the progress of the channels that were already scraped and the
+    links they produced. The journal is folded into the snapshot file with an atomic rename
+    on `commit` or once it reaches `compact_every` entries. Journal entries carry a sequence
+    number that the snapshot records, so replaying a journal that was already compacted is a
+    no-op.
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, compact_every=200):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or f"{snapshot_path}.journal"
+        self.compact_every = compact_every
+        self.state = {}
+        self.pending = {}
+        self.seq = 0
+        self.journal_entries = 0
+        self.load()
+
+    def load(self):
+        snapshot = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r') as f: snapshot = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logging.error(f"Error loading state file, replaying the journal only: {e}")
+        self.seq = snapshot.pop(JOURNAL_SEQ_KEY, 0)
+        self.pending = {protocol: set(links) for protocol, links in snapshot.pop(PENDING_KEY, {}).items()}
+        self.state = snapshot
+
+        replayed, torn = 0, False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning("Ignoring a truncated state journal entry.")
+                        torn = True
+                        continue
+                    self.journal_entries += 1
+                    if entry['seq'] > self.seq:
+                        self._apply(entry)
+                        self.seq = entry['seq']
+                        replayed += 1
+        if replayed:
+            logging.info(f"Resumed {replayed} channel checkpoints and "
+                         f"{sum(map(len, self.pending.values()))} unpublished links from the state journal.")
+        if torn:
+            # New entries must not be appended to the torn line.
+            self.compact()
+
+    def _apply(self, entry):
+        channel_id_str = entry['channel']
+        if entry.get('last_id'):
+            self.state[channel_id_str] = max(self.state.get(channel_id_str, 0), entry['last_id'])
+        if entry.get('fetched_at'):
+            self.state.setdefault(FETCHED_AT_KEY, {})[channel_id_str] = entry['fetched_at']
+        for protocol, links in entry.get('links', {}).items():
+            self.pending.setdefault(protocol, set()).update(links)
+
+    def checkpoint(self, channel_id_str, last_id=0, fetched_at=None, links=None):
+        """Durably records one channel's new watermark and the links it produced."""
+        self.seq += 1
+        entry = {'seq': self.seq, 'channel': channel_id_str, 'last_id': last_id, 'fetched_at': fetched_at,
+                 'links': {protocol: sorted(protocol_links) for protocol, protocol_links in (links or {}).items() if protocol_links}}
+        self._apply(entry)
+        try:
+            with open(self.journal_path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except IOError as e:
+            logging.error(f"Error writing state journal: {e}")
+        self.journal_entries += 1
+        if self.journal_entries >= self.compact_every:
+            self.compact()
+
+    def pending_links(self):
+        """Returns {protocol: set(links)} scraped but not yet committed as published."""
+        return {protocol: set(links) for protocol, links in self.pending.items()}
+
+    def commit(self):
+        """Marks all pending links as published and compacts the journal into the snapshot."""
+        self.pending = {}
+        self.compact()
+
+    def compact(self):
+        snapshot = dict(self.state)
+        snapshot[JOURNAL_SEQ_KEY] = self.seq
+        if any(self.pending.values()):
+            snapshot[PENDING_KEY] = {protocol: sorted(links) for protocol, links in self.pending.items() if links}
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+            atomic_write_json(self.snapshot_path, snapshot, indent=4)
+            # The snapshot now covers every journal entry, so the journal can start over.
+            open(self.journal_path, 'w').close()
+            self.journal_entries = 0
+        except IOError as e:
+            logging.error(f"Error saving state file: {e}")
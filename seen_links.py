@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+
+# SQLite caps the number of bound parameters per statement; stay well below it.
+LOOKUP_BATCH_SIZE = 500
+
+
+def link_key(link):
+    """A fixed-size 16-byte digest, so the index size does not depend on link length."""
+    return hashlib.blake2b(link.encode('utf-8'), digest_size=16).digest()
+
+
+class SeenLinkIndex:
+    """Persistent index of already-published links, shared across cycles and restarts.
+
+    Each entry stores the protocol and the first/last time the link was seen. Entries that
+    have not been seen for `ttl` seconds are evicted, which keeps the index bounded and lets
+    a long-gone proxy be published again if it ever comes back. `key_func(protocol, link)`
+    chooses what counts as the same link; by default it is the raw link string.
+    """
+
+    def __init__(self, path, ttl, key_func=None):
+        self.path = path
+        self.ttl = ttl
+        self.key_func = key_func or (lambda protocol, link: link)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS seen_links (
+                key BLOB PRIMARY KEY,
+                protocol TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS seen_links_last_seen ON seen_links (last_seen)")
+        self.db.commit()
+
+    def filter_new(self, categorized_links, now=None):
+        """Returns only the links not already in the index, refreshing last_seen on the rest.
+
+        Takes and returns {protocol: iterable(links)}; the result keeps the input order. New
+        links are not recorded here: call mark_published once they have actually gone out, so
+        a crash or failed send in between leaves them to be published again.
+        """
+        now = time.time() if now is None else now
+        new_links = {}
+        with self.db:
+            for protocol, links in categorized_links.items():
+                links = list(dict.fromkeys(links))
+                keys = [link_key(self.key_func(protocol, link)) for link in links]
+                known = set()
+                for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                    batch = keys[i:i + LOOKUP_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch))
+                    known.update(row[0] for row in self.db.execute(
+                        f"SELECT key FROM seen_links WHERE key IN ({placeholders})", batch))
+                self.db.executemany("UPDATE seen_links SET last_seen = ? WHERE key = ?",
+                                    ((now, key) for key in known))
+                new_links[protocol] = [link for link, key in zip(links, keys) if key not in known]
+        return new_links
+
+    def mark_published(self, categorized_links, now=None):
+        """Records links ({protocol: iterable(links)}) as published."""
+        now = time.time() if now is None else now
+        with self.db:
+            self.db.executemany("""
+                INSERT INTO seen_links (key, protocol, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET last_seen = excluded.last_seen
+            """, ((link_key(self.key_func(protocol, link)), protocol, now, now)
+                  for protocol, links in categorized_links.items() for link in links))
+
+    def evict(self, now=None):
+        """Drops entries not seen within the TTL and returns how many were removed."""
+        now = time.time() if now is None else now
+        with self.db:
+            cursor = self.db.execute("DELETE FROM seen_links WHERE last_seen < ?", (now - self.ttl,))
+        if cursor.rowcount:
+            logging.info(f"Evicted {cursor.rowcount} links not seen for {int(self.ttl / 86400)} days.")
+        return cursor.rowcount
+
+    def counts(self):
+        """Returns {protocol: number of indexed links}."""
+        return dict(self.db.execute("SELECT protocol, COUNT(*) FROM seen_links GROUP BY protocol"))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,126 @@
+import base64
+import gzip
+import hashlib
+import logging
+import os
+from collections import deque
+
+from httpd import start_http_server
+from metrics import registry as metrics
+
+# Protocols that v2ray-style clients (v2rayN/NG, Nekoray, ...) import from a base64 subscription.
+V2RAY_PROTOCOLS = ('VLESS', 'VMESS', 'SHADOWSOCKS')
+
+
+class Feed:
+    """One served body with its gzip version and their ETags, all built once per change."""
+
+    def __init__(self, content_type):
+        self.content_type = content_type
+        self.variants = {}
+
+    def update(self, body):
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.variants = {'identity': (f'"{digest}"', body), 'gzip': (f'"{digest}-gz"', gzip.compress(body, mtime=0))}
+
+
+def etag_matches(if_none_match, etag):
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags
+
+
+class SubscriptionStore:
+    """Per-protocol subscription lists, kept on disk and served over HTTP.
+
+    Each protocol keeps its recent links in `<PROTOCOL>.txt` (one per line), and `v2ray.b64`
+    holds VLESS, VMess and Shadowsocks together as a base64 v2ray subscription. New links are
+    appended to the protocol files as they are published; once a list grows a quarter past
+    `max_links` it is trimmed back to the newest `max_links` and its file rewritten. Bodies are built
+    once per change, so a request costs a dict lookup, and a client that sends the last ETag
+    in If-None-Match gets an empty 304.
+    """
+
+    def __init__(self, directory, protocols, max_links=1000):
+        self.directory = directory
+        self.max_links = max_links
+        os.makedirs(directory, exist_ok=True)
+        self.links = {protocol: deque() for protocol in protocols}
+        self.feeds = {f"/sub/{protocol.lower()}": Feed('text/plain; charset=utf-8') for protocol in protocols}
+        self.feeds['/sub/v2ray'] = Feed('text/plain; charset=utf-8')
+        for protocol in protocols:
+            path = self._path(protocol)
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    self.links[protocol].extend(line.strip() for line in f if line.strip())
+                self._trim(protocol)
+        self._rebuild(protocols)
+
+    def _path(self, protocol):
+        return os.path.join(self.directory, f"{protocol}.txt")
+
+    def _trim(self, protocol):
+        links = self.links[protocol]
+        if len(links) <= self.max_links * 1.25:
+            return
+        while len(links) > self.max_links:
+            links.popleft()
+        tmp_path = f"{self._path(protocol)}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(f"{link}\n" for link in links)
+        os.replace(tmp_path, self._path(protocol))
+
+    def _rebuild(self, protocols):
+        for protocol in protocols:
+            self.feeds[f"/sub/{protocol.lower()}"].update("".join(f"{link}\n" for link in self.links[protocol]).encode())
+        if any(protocol in V2RAY_PROTOCOLS for protocol in protocols):
+            plain = "".join(f"{link}\n" for protocol in V2RAY_PROTOCOLS for link in self.links.get(protocol, ()))
+            body = base64.b64encode(plain.encode())
+            self.feeds['/sub/v2ray'].update(body)
+            tmp_path = os.path.join(self.directory, 'v2ray.b64.tmp')
+            with open(tmp_path, 'wb') as f: f.write(body)
+            os.replace(tmp_path, os.path.join(self.directory, 'v2ray.b64'))
+
+    def add(self, categorized_links):
+        """Appends newly published links ({protocol: [links]}) to their feeds."""
+        changed = []
+        for protocol, links in categorized_links.items():
+            if not links or protocol not in self.links:
+                continue
+            self.links[protocol].extend(links)
+            try:
+                with open(self._path(protocol), 'a') as f:
+                    f.writelines(f"{link}\n" for link in links)
+                self._trim(protocol)
+            except IOError as e:
+                logging.error(f"Error writing subscription file for {protocol}: {e}")
+            changed.append(protocol)
+        if changed:
+            self._rebuild(changed)
+            logging.info(f"Updated subscriptions: {', '.join(protocol.lower() for protocol in changed)}.")
+
+    def counts(self):
+        return {protocol: len(links) for protocol, links in self.links.items()}
+
+    async def handle(self, method, path, headers):
+        feed = self.feeds.get(path)
+        if method not in ('GET', 'HEAD'):
+            response = 405, {}, b""
+        elif feed is None:
+            response = 404, {}, b""
+        else:
+            encoding = 'gzip' if 'gzip' in headers.get('accept-encoding', '') else 'identity'
+            etag, body = feed.variants[encoding]
+            response_headers = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+            if etag_matches(headers.get('if-none-match', ''), etag):
+                response = 304, response_headers, b""
+            else:
+                response_headers['Content-Type'] = feed.content_type
+                if encoding == 'gzip':
+                    response_headers['Content-Encoding'] = 'gzip'
+                response = 200, response_headers, body
+        metrics.inc('subscription_requests_total', status=response[0])
+        return response
+
+    async def serve(self, host, port):
+        """Serves every feed on http://host:port/sub/<protocol> and /sub/v2ray."""
+        return await start_http_server(host, port, self.handle)
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import os
 import pandas as pd
@@ -5,10 +6,15 @@ import logging
 import time
 import socks
 from telethon import TelegramClient
-from telethon.tl.types import InputPeerUser
+from telethon.tl.types import ChannelParticipantsRecent, InputPeerUser
 # Import the specific error for handling flood waits
 from telethon.errors.rpcerrorlist import PeerFloodError, UserIsBlockedError, FloodWaitError
 
+from credential_store import CredentialStore
+from media_cache import MediaCache
+from publisher import AdaptiveRateLimiter
+from sessions import Session, SessionPool, rendezvous_rank
+
 # --- 1. CONFIGURATION (تنظیمات) ---
 # Your personal account credentials
 API_ID = 2
@@ -24,16 +30,41 @@ PROXY_DETAILS = {
     'port': 1080, # Make sure this is your SOCKS port
 }
 
+# Accounts that share the work as (session name, proxy). Members are split between them by a
+# stable hash, and a member whose account gets limited is picked up by the others. Every
+# account must be a member of the target group.
+SESSIONS = [
+    ('distributor_session', PROXY_DETAILS),
+]
+
 # File paths
 EXCEL_FILE_PATH = 'sshs.xlsx'
 SENT_USERS_FILE = 'sent_users.txt'
+# Claims live here; the Excel file is only read to import new credentials and written on export.
+CREDENTIAL_DB_FILE = 'credentials.sqlite3'
+# Guide images are uploaded once and then re-sent by reference; see media_cache.py. Uploaded
+# photos belong to one account, so every session after the first gets media_cache.<name>.json.
+MEDIA_CACHE_FILE = 'media_cache.json'
 
 # SSH Config constants
 SSH_PORT = 38742
 UDG_PORT = 37300
 
-# Delay between sending messages to different users to avoid spam flags
-DELAY_BETWEEN_USERS = 120  # 20 seconds is a safe delay
+# Pacing of private messages (seconds between sends across all users in flight). The gap
+# shrinks while sends succeed and doubles on every flood error, within these bounds.
+SEND_INTERVAL_START = 20
+SEND_INTERVAL_MIN = 5
+SEND_INTERVAL_MAX = 300
+# Users served at the same time; they share the send pacing above.
+CONCURRENT_USERS = 3
+# Global pause after a PeerFloodError, which does not say how long to wait.
+PEER_FLOOD_PAUSE = 1800
+# Consecutive PeerFloodErrors after which an account is taken out of the run.
+MAX_PEER_FLOODS = 3
+# Members who join during a run are picked up by re-reading the newest members this often
+# (0 disables it). A refresh stops after this many members in a row that were already seen.
+MEMBER_REFRESH_INTERVAL = 600
+MEMBER_REFRESH_KNOWN_STREAK = 50
 
 # --- 2. LOGGING SETUP ---
 logging.basicConfig(
@@ -56,67 +87,55 @@ def add_sent_user(user_id):
     with open(SENT_USERS_FILE, 'a') as f:
         f.write(f"{user_id}\n")
 
-
-# --- 4. CORE DISTRIBUTION LOGIC ---
-async def main():
-    """Main script to connect, get members, and distribute credentials."""
-    
-    client = TelegramClient(
-        'distributor_session', 
-        API_ID, 
-        API_HASH, 
-        proxy=PROXY_DETAILS
-    )
-    
-    print("Connecting to Telegram with your account...")
-    await client.start()
-    print("Connection successful.")
-
+def import_credentials(store):
+    """Imports credentials from the Excel file that are not in the store yet."""
     try:
         df = pd.read_excel(EXCEL_FILE_PATH)
-        df.columns = df.columns.str.strip()
-        logger.info(f"Successfully loaded {EXCEL_FILE_PATH}.")
-        
-        required_columns = {'USER Names', 'password', 'hostname', 'taken'}
-        if not required_columns.issubset(df.columns):
-            missing = required_columns - set(df.columns)
-            logger.critical(f"CRITICAL ERROR: Excel file is missing columns: {missing}")
-            return
-            
     except FileNotFoundError:
+        if store.counts():
+            logger.warning(f"'{EXCEL_FILE_PATH}' not found. Using the {sum(store.counts().values())} credentials already in {CREDENTIAL_DB_FILE}.")
+            return True
         logger.critical(f"CRITICAL ERROR: The file '{EXCEL_FILE_PATH}' was not found.")
-        return
-
-    sent_users = load_sent_users()
-    logger.info(f"Loaded {len(sent_users)} users who have already received credentials.")
-
-    print(f"Fetching members from group ID {TARGET_GROUP_ID}...")
-    try:
-        all_participants = await client.get_participants(TARGET_GROUP_ID)
-    except Exception as e:
-        logger.critical(f"Could not fetch group members. Error: {e}")
-        return
-    
-    print(f"Found {len(all_participants)} total members. Starting distribution...")
-
-    for user in all_participants:
-        if user.bot or user.id in sent_users:
-            continue
-            
-        available_creds = df[df['taken'] == False]
-        if available_creds.empty:
-            logger.warning("No more available credentials left. Stopping.")
-            break
-            
-        row = available_creds.iloc[0]
-        row_index = row.name
-        
-        username = row['USER Names']
-        password = row['password']
-        hostname = row['hostname']
-        
-        # --- Format the messages (RESTORED TO FULL DETAIL) ---
-        intro_message = """
+        return False
+    df.columns = df.columns.str.strip()
+
+    required_columns = {'USER Names', 'password', 'hostname', 'taken'}
+    if not required_columns.issubset(df.columns):
+        missing = required_columns - set(df.columns)
+        logger.critical(f"CRITICAL ERROR: Excel file is missing columns: {missing}")
+        return False
+
+    added = store.import_rows(zip(df['USER Names'], df['password'], df['hostname'], df['taken'] != False))
+    logger.info(f"Successfully loaded {EXCEL_FILE_PATH}: {added} new credentials imported, pool is now {store.counts()}.")
+    return True
+
+def export_credentials(store):
+    """Writes the store's taken flags back to the Excel file, keeping any extra columns."""
+    rows = pd.DataFrame(list(store.rows()), columns=['USER Names', 'password', 'hostname', 'taken'])
+    if os.path.exists(EXCEL_FILE_PATH):
+        df = pd.read_excel(EXCEL_FILE_PATH)
+        df.columns = df.columns.str.strip()
+        taken = dict(zip(rows['USER Names'], rows['taken']))
+        df['taken'] = [taken.get(str(name).strip(), flag) for name, flag in zip(df['USER Names'], df['taken'])]
+        known = {str(name).strip() for name in df['USER Names']}
+        rows = pd.concat([df, rows[~rows['USER Names'].isin(known)]], ignore_index=True)
+    rows.to_excel(EXCEL_FILE_PATH, index=False)
+    logger.info(f"Exported {len(rows)} credentials to {EXCEL_FILE_PATH}.")
+
+
+def settle_failed_claim(store, user, credential_delivered):
+    """Frees the user's claim, unless the credential itself already reached them."""
+    if credential_delivered:
+        logger.warning(f"Credential already delivered to {user.first_name} (ID: {user.id}); keeping it marked as sent.")
+        store.mark_sent(user.id)
+    else:
+        store.release(user.id)
+
+
+def build_messages(username, password, hostname):
+    """Returns the per-user texts and guide images, in sending order."""
+    # --- Format the messages (RESTORED TO FULL DETAIL) ---
+    intro_message = """
 سلام نازنین،
 
 پیام های زیر حاوی یک اتصال اختصاصی دو کاربر برای دور زدن محدودیت های اینترنتی هست که به صورت اختصاصی برای اعضای خانواده فیزیک دانشگاه شریف فراهم شده. اون ها رو بخون و استفاده کن.
@@ -127,7 +146,7 @@ async def main():
 از هم دیگه دست بگیریم و به هم کمک کنیم.
 """
 
-        credential_message = f"""
+    credential_message = f"""
 🎉 **کانفیگ اختصاصی شما آماده شد!**
 
 *📱 NapsternetV (iOS & Android)*
@@ -149,7 +168,7 @@ async def main():
 _روی کانفیگ‌های بالا کلیک کنید تا به صورت خودکار کپی شوند._
 """
 
-        ios_caption = """
+    ios_caption = """
 *راهنمای اتصال در آیفون (iOS) با NapsternetV*
 
 ۱. برنامه را از اپ استور نصب کنید.
@@ -158,9 +177,9 @@ _روی کانفیگ‌های بالا کلیک کنید تا به صورت خو
 
 [لینک دانلود از اپ استور](https://apps.apple.com/us/app/napsternetv/id1629465476)
 """
-        ios_images = ["ios/napster.jpg"]
+    ios_images = ["ios/napster.jpg"]
 
-        android_caption = """
+    android_caption = """
 *راهنمای اتصال در اندروید با NapsternetV*
 
 ۱. برنامه را از گوگل پلی یا لینک مستقیم نصب کنید.
@@ -169,54 +188,277 @@ _روی کانفیگ‌های بالا کلیک کنید تا به صورت خو
 
 [دانلود از گوگل پلی](https://play.google.com/store/apps/details?id=com.napsternetlabs.napsternetv)
 """
-        android_images = ["android/a1.jpg", "android/a2.jpg", "android/a3.jpg", "android/a4.jpg", "android/a5.jpg", "android/a6.jpg", "android/a7.jpg"]
-        
-        # --- Retry loop for sending messages ---
-        while True: # Loop to retry sending to the same user if a flood wait occurs
+    android_images = ["android/a1.jpg", "android/a2.jpg", "android/a3.jpg", "android/a4.jpg", "android/a5.jpg", "android/a6.jpg", "android/a7.jpg"]
+    return intro_message, credential_message, (ios_images, ios_caption), (android_images, android_caption)
+
+
+async def limited_send(limiter, send, *args, **kwargs):
+    """Runs one Telegram send through the shared limiter, waiting out flood waits and retrying."""
+    while True:
+        await limiter.acquire()
+        try:
+            result = await send(*args, **kwargs)
+        except FloodWaitError as e:
+            # This is the specific error for "A wait of X seconds is required"
+            wait_time = e.seconds + 5 # Add a 5-second buffer to be safe
+            logger.warning(f"Flood wait triggered. Pausing all sends for {wait_time} seconds...")
+            limiter.flood(wait_time)
+            continue
+        except PeerFloodError:
+            limiter.flood(PEER_FLOOD_PAUSE)
+            raise
+        limiter.success()
+        return result
+
+
+async def serve_user(client, store, media_cache, limiter, user):
+    """Sends one user their credential and guides; returns False if the pool is empty."""
+    credential = store.claim(user.id)
+    if credential is None:
+        return False
+    intro_message, credential_message, *guides = build_messages(*credential)
+
+    credential_delivered = False
+    try:
+        print(f"\nAttempting to send credentials to user: {user.first_name} (ID: {user.id})")
+        await limited_send(limiter, client.send_message, user.id, intro_message)
+        await limited_send(limiter, client.send_message, user.id, credential_message, parse_mode='md')
+        credential_delivered = True
+        for images, caption in guides:
+            await limited_send(limiter, media_cache.send_file, client, user.id, images, caption=caption, parse_mode='md')
+
+        store.mark_sent(user.id)
+        add_sent_user(user.id)
+        logger.info(f"SUCCESS: Credentials sent to {user.first_name} (ID: {user.id})")
+
+    except PeerFloodError as e:
+        logger.error(f"FAILED to send to {user.first_name}: {e}. Skipping user.")
+        settle_failed_claim(store, user, credential_delivered)
+        raise
+
+    except UserIsBlockedError as e:
+        logger.error(f"FAILED to send to {user.first_name}: {e}. Skipping user.")
+        settle_failed_claim(store, user, credential_delivered)
+
+    except Exception as e:
+        logger.error(f"An unexpected error occurred for {user.first_name}: {e}. Skipping user.")
+        settle_failed_claim(store, user, credential_delivered)
+    return True
+
+
+async def iter_members(client, refresh_interval=MEMBER_REFRESH_INTERVAL, known_streak=MEMBER_REFRESH_KNOWN_STREAK):
+    """Yields the group's members as their pages arrive, then the ones who join later.
+
+    The full member list is walked once with iter_participants, so the first credential goes
+    out as soon as the first page is in, and only one page is held in memory. Every
+    `refresh_interval` seconds the newest members (ChannelParticipantsRecent, newest first)
+    are read again until `known_streak` already-seen members in a row.
+
+    The walk is paced by the sends, so it can take hours, and members leaving meanwhile shift
+    the offset pages and make it skip others. Once it ends the list is walked again back to
+    back, holding only the members the first walk missed, and those are yielded afterwards.
+    The stream then ends at the first refresh that finds nobody new.
+    """
+    seen = set()
+    last_refresh = time.monotonic()
+
+    async def refresh():
+        newcomers, streak = [], 0
+        async for user in client.iter_participants(TARGET_GROUP_ID, filter=ChannelParticipantsRecent()):
+            if user.id in seen:
+                streak += 1
+                if streak >= known_streak:
+                    break
+                continue
+            streak = 0
+            seen.add(user.id)
+            newcomers.append(user)
+        if newcomers:
+            logger.info(f"Member refresh found {len(newcomers)} new members.")
+        return newcomers
+
+    # Newest first, the same order the refreshes read, so a refresh stops at the first page.
+    async for user in client.iter_participants(TARGET_GROUP_ID, filter=ChannelParticipantsRecent()):
+        if user.id not in seen:
+            seen.add(user.id)
+            yield user
+        if refresh_interval and time.monotonic() - last_refresh >= refresh_interval:
+            for newcomer in await refresh():
+                yield newcomer
+            last_refresh = time.monotonic()
+    logger.info(f"Walked all {len(seen)} members of group {TARGET_GROUP_ID}.")
+
+    missed = []
+    async for user in client.iter_participants(TARGET_GROUP_ID, filter=ChannelParticipantsRecent()):
+        if user.id not in seen:
+            seen.add(user.id)
+            missed.append(user)
+    if missed:
+        logger.info(f"Second walk found {len(missed)} members the first walk skipped.")
+    for user in missed:
+        yield user
+
+    while refresh_interval:
+        await asyncio.sleep(max(0, last_refresh + refresh_interval - time.monotonic()))
+        newcomers = await refresh()
+        last_refresh = time.monotonic()
+        if not newcomers:
+            return
+        for newcomer in newcomers:
+            yield newcomer
+
+
+async def distribute(client, store, media_cache, participants, sent_users, limiter, concurrency=CONCURRENT_USERS):
+    """Serves every eligible participant from the async iterable `participants`, with
+    `concurrency` users in flight.
+
+    Progress lives in the credential store, so an interrupted run resumes by skipping the
+    users already marked sent and re-serving any user left with an open claim. Returns False
+    if the account hit MAX_PEER_FLOODS consecutive PeerFloodErrors and stopped early.
+    """
+    queue = asyncio.Queue(maxsize=concurrency)
+    exhausted, limited = asyncio.Event(), asyncio.Event()
+    peer_floods = 0
+
+    async def worker():
+        nonlocal peer_floods
+        while True:
+            user = await queue.get()
             try:
-                print(f"\nAttempting to send credentials to user: {user.first_name} (ID: {user.id})")
-                
-                await client.send_message(user.id, intro_message)
-                await asyncio.sleep(2)
-                
-                await client.send_message(user.id, credential_message, parse_mode='md')
-                await asyncio.sleep(2)
-                
-                await client.send_file(user.id, ios_images, caption=ios_caption, parse_mode='md')
-                await asyncio.sleep(2)
-
-                await client.send_file(user.id, android_images, caption=android_caption, parse_mode='md')
-                
-                # If all sends are successful, update state and break the retry loop
-                df.at[row_index, 'taken'] = True
-                df.to_excel(EXCEL_FILE_PATH, index=False)
-                add_sent_user(user.id)
-                sent_users.add(user.id)
-                
-                logger.info(f"SUCCESS: Credentials sent to {user.first_name} (ID: {user.id})")
-                break # Exit the retry loop and move to the next user
-
-            except FloodWaitError as e:
-                # This is the specific error for "A wait of X seconds is required"
-                wait_time = e.seconds + 5 # Add a 5-second buffer to be safe
-                logger.warning(f"Flood wait triggered. Pausing for {wait_time} seconds...")
-                await asyncio.sleep(wait_time)
-                # After sleeping, the while loop will automatically retry for the same user
-            
-            except (UserIsBlockedError, PeerFloodError) as e:
-                logger.error(f"FAILED to send to {user.first_name}: {e}. Skipping user.")
-                break # Exit the retry loop and move to the next user (skip this one)
-
-            except Exception as e:
-                logger.error(f"An unexpected error occurred for {user.first_name}: {e}. Skipping user.")
-                break # Exit the retry loop and move on
-
-        # Wait before processing the next user to avoid spam flags
-        print(f"Waiting for {DELAY_BETWEEN_USERS} seconds before next user...")
-        await asyncio.sleep(DELAY_BETWEEN_USERS)
+                if user is None:
+                    return
+                if exhausted.is_set() or limited.is_set():
+                    continue
+                if not await serve_user(client, store, media_cache, limiter, user):
+                    logger.warning("No more available credentials left. Stopping.")
+                    exhausted.set()
+                peer_floods = 0
+            except PeerFloodError:
+                peer_floods += 1
+                if peer_floods >= MAX_PEER_FLOODS:
+                    limited.set()
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        async for user in participants:
+            if exhausted.is_set() or limited.is_set():
+                break
+            if user.bot or user.id in sent_users:
+                continue
+            await queue.put(user)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    return not limited.is_set()
+
+
+async def distribute_sharded(pool, store, media_caches, limiters):
+    """Splits the group between the pool's sessions and serves each share concurrently.
+
+    Every session streams the member list itself, because user access hashes are per account,
+    and keeps the members it owns among the sessions that started the pass, so a session
+    coming back from its cooldown mid-pass does not take members the others are skipping.
+    When a session is limited mid-run, another pass is made with the remaining sessions if
+    any of its eligible members are still unserved.
+    """
+    async def serve_share(session, names, sent_users, eligible):
+        def owns(user):
+            owner = rendezvous_rank(user.id, names)[0]
+            if not user.bot and user.id not in sent_users:
+                eligible.setdefault(owner, set()).add(user.id)
+            return owner == session.name
+
+        members = iter_members(session.client, MEMBER_REFRESH_INTERVAL, MEMBER_REFRESH_KNOWN_STREAK)
+        share = (user async for user in members if owns(user))
+        print(f"Session {session.name}: streaming members. Starting distribution...")
+        try:
+            finished = await distribute(session.client, store, media_caches[session.name], share, sent_users,
+                                        limiters[session.name], CONCURRENT_USERS)
+        except Exception as e:
+            pool.mark_failed(session, f"could not fetch group members: {e}")
+            return False
+        if finished:
+            return True
+        pool.mark_failed(session, "account limited by PeerFloodError", PEER_FLOOD_PAUSE)
+        return False
+
+    while True:
+        sessions = pool.alive()
+        if not sessions:
+            logger.critical("Every Telegram session has failed. Stopping.")
+            return
+        names = [session.name for session in sessions]
+        sent_users = load_sent_users() | store.sent_user_ids()
+        logger.info(f"Loaded {len(sent_users)} users who have already received credentials.")
+        # Owner name -> ids of the eligible members it was given, as seen by every session's walk.
+        eligible = {}
+        results = await asyncio.gather(*(serve_share(session, names, sent_users, eligible) for session in sessions))
+        failed = [session.name for session, finished in zip(sessions, results) if not finished]
+        unserved = set().union(*(eligible.get(name, ()) for name in failed)) - store.sent_user_ids()
+        # With every session failed the walks may be partial; the next pass decides whether to stop.
+        if not store.counts().get('free') or (any(results) and not unserved):
+            return
+        logger.warning(f"Sessions {failed} failed with {len(unserved)} of their members unserved; "
+                       f"redistributing them to the remaining sessions.")
+
+
+# --- 4. CORE DISTRIBUTION LOGIC ---
+async def main():
+    """Main script to connect, get members, and distribute credentials."""
+    
+    store = CredentialStore(CREDENTIAL_DB_FILE)
+    if not import_credentials(store):
+        return
+    pending = store.pending_claims()
+    if pending:
+        # Left by an interrupted run; these users get the same credential again when reached.
+        logger.warning(f"{len(pending)} credentials are claimed but not confirmed as sent: {pending}")
+
+    sessions, media_caches, limiters = [], {}, {}
+    for i, (session_name, proxy) in enumerate(SESSIONS):
+        client = TelegramClient(
+            session_name, 
+            API_ID, 
+            API_HASH, 
+            proxy=proxy
+        )
+        
+        print(f"Connecting to Telegram with account {session_name}...")
+        try:
+            await client.start()
+        except Exception as e:
+            logger.error(f"Could not connect account {session_name}: {e}")
+            continue
+        print("Connection successful.")
+        sessions.append(Session(session_name, client))
+        media_caches[session_name] = MediaCache(MEDIA_CACHE_FILE if i == 0 else f"media_cache.{session_name}.json")
+        # Flood limits are per account, so every session paces itself.
+        limiters[session_name] = AdaptiveRateLimiter(SEND_INTERVAL_START, SEND_INTERVAL_MIN, SEND_INTERVAL_MAX)
+    if not sessions:
+        logger.critical("Could not connect any Telegram account.")
+        return
+
+    print(f"Fetching members from group ID {TARGET_GROUP_ID}...")
+    await distribute_sharded(SessionPool(sessions, PEER_FLOOD_PAUSE), store, media_caches, limiters)
 
     print("\nDistribution script finished.")
-    await client.disconnect()
+    export_credentials(store)
+    store.close()
+    for session in sessions:
+        await session.client.disconnect()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Distribute SSH credentials to the members of a Telegram group.")
+    parser.add_argument('--export', action='store_true', help=f"write the credential store back to {EXCEL_FILE_PATH} and exit")
+    args = parser.parse_args()
+    if args.export:
+        store = CredentialStore(CREDENTIAL_DB_FILE)
+        export_credentials(store)
+        store.close()
+    else:
+        asyncio.run(main())